@@ -1,169 +1,273 @@
+import json
 import logging
+import threading
+import zlib
 from datetime import datetime
-from typing import Any, Dict, List, Optional, cast
-
-import mgrs  # type: ignore
-from fastapi import APIRouter, HTTPException
-
-from app.schemas.schema import TransformedAircraft
-from app.schemas.schema_marine_traffic import ShipFeature
+from typing import Any, Dict, List, Optional, Tuple, cast
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+from app.clustering import MAX_PRECISION, MIN_PRECISION, cluster_tracks, with_precision
+from app.config import settings
+from app.conflict import detect_conflicts
+from app.enrichment import refresh_if_stale
+from app.geofence import geofence_monitor
+from app.replay_log import replay_log
+from app.schemas.schema import Conflict, TrackCluster, TransformedAircraft
+from app.schemas.schema_geofence import GeofenceEvent, GeofenceZone
+from app.snapshot import Snapshot
+from app.spatial import SpatialIndex, SpatialQuery, parse_query, query_cache
 from app.tasks.practice_task import fetch_practice_data
 from app.tasks.radar_task import fetch_aircraft_data
 from app.tasks.marine_traffic_task import fetch_fin_marine_traffic_data
+from app.tasks.scheduler import poll_scheduler
+from app.transform import (
+    DEFAULT_PRECISION,
+    SNAPSHOT_PRECISION,
+    rows_to_tracks,
+    transform_chunked,
+    transform_marine_rows,
+    transform_opensky_rows,
+    transform_practice_rows,
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/radar", tags=["radar"])
 
-mgrs_converter = mgrs.MGRS()
-
 
-def to_mgrs_typed(latitude: float, longitude: float) -> str:
-    mgrs_string: str = mgrs_converter.toMGRS(latitude, longitude, True, 1)  # pyright: ignore[reportUnknownMemberType]
-    return mgrs_string
+def build_snapshot(
+    data: List[Dict[str, Any]],
+    raw_practice_data: List[TransformedAircraft],
+    raw_fin_marine_data: List[Dict[str, Any]],
+) -> Snapshot:
+    rows = [
+        *transform_practice_rows(cast(List[Dict[str, Any]], raw_practice_data)),
+        *transform_chunked(transform_opensky_rows, data, SNAPSHOT_PRECISION),
+        *transform_chunked(transform_marine_rows, raw_fin_marine_data, SNAPSHOT_PRECISION),
+    ]
+    tracks, points = rows_to_tracks(rows)
+    return Snapshot(tracks=tracks, points=points)
 
 
-def convert_timestamp_to_datetime(timestamp: Optional[int]) -> Optional[str]:
-    """Convert UNIX timestamp to formatted datetime string."""
-    if timestamp is None:
-        return None
+def publish_snapshot(snapshot: Snapshot) -> None:
+    """Run the server-side consumers of a freshly built snapshot"""
     try:
-        dt = datetime.fromtimestamp(timestamp)
-        return dt.strftime("%d.%m.%Y %H:%M:%S")
+        for event in geofence_monitor.evaluate(snapshot.points, snapshot.timestamp):
+            logger.info(f"Geofence {event['event']}: {event['trackId']} in zone {event['zoneId']}")
     except Exception as e:
-        logger.error(f"Error converting timestamp {timestamp}: {e}")
-        return None
+        logger.error(f"Error evaluating geofences: {e}")
+
+    if replay_log is not None:
+        try:
+            replay_log.append(snapshot.timestamp, snapshot.tracks)
+        except Exception as e:
+            logger.error(f"Error writing snapshot to replay log: {e}")
+
+
+def snapshot_tracks(snapshot: Snapshot, precision: int) -> List[TransformedAircraft]:
+    if precision >= SNAPSHOT_PRECISION:
+        return snapshot.tracks
+    return snapshot.cached(
+        ("tracks", precision), lambda: with_precision(snapshot.tracks, precision)
+    )
+
+
+def snapshot_clusters(snapshot: Snapshot, precision: int) -> List[TrackCluster]:
+    return snapshot.cached(
+        ("clusters", precision), lambda: cluster_tracks(snapshot.tracks, precision)
+    )
+
+
+def snapshot_query(
+    snapshot: Snapshot, precision: int, query: SpatialQuery
+) -> List[TransformedAircraft]:
+    def run() -> List[TransformedAircraft]:
+        index = snapshot.cached(
+            "spatial_index",
+            lambda: SpatialIndex(snapshot.tracks, snapshot.points, settings.spatial_grid_size),
+        )
+        tracks = snapshot_tracks(snapshot, precision)
+        return [tracks[track_index] for track_index in index.query(query)]
 
+    return query_cache.get((snapshot.version, precision, query), run)
 
-def convert_to_mgrs(longitude: Optional[float], latitude: Optional[float]) -> Optional[str]:
-    if longitude is None or latitude is None:
-        return None
+
+def snapshot_conflicts(snapshot: Snapshot) -> List[Conflict]:
+    return snapshot.cached(
+        "conflicts",
+        lambda: detect_conflicts(
+            snapshot.points,
+            settings.conflict_distance_km,
+            settings.conflict_altitude_band_m,
+            settings.conflict_horizon_seconds,
+            settings.conflict_types,
+        ),
+    )
+
+
+# Source generations the published snapshot was built from
+_published: Optional[Tuple[Tuple[int, ...], Snapshot]] = None
+_published_lock = threading.Lock()
+
+
+def current_snapshot() -> Snapshot:
+    """Latest snapshot, rebuilt only when one of the sources has been fetched again"""
+    global _published
     try:
-        mgrs_string: str = to_mgrs_typed(latitude, longitude)
-        return mgrs_string.strip().replace(" ", "")
+        refresh_if_stale()
+        sources = (
+            poll_scheduler.poll("openSky", fetch_aircraft_data),
+            poll_scheduler.poll("practiceTool", fetch_practice_data),
+            poll_scheduler.poll("marineTraffic", fetch_fin_marine_traffic_data),
+        )
+        generations = tuple(source.generation for source in sources)
+        with _published_lock:
+            if _published is None or _published[0] != generations:
+                snapshot = build_snapshot(*(source.records for source in sources))
+                publish_snapshot(snapshot)
+                _published = (generations, snapshot)
+            return _published[1]
+
     except Exception as e:
-        logger.error(f"Error converting coordinates ({latitude}, {longitude}) to MGRS: {e}")
-        return None
+        logger.error(f"Error retrieving aircraft data: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
-def classify_altitude(altitude: Optional[float]) -> Optional[str]:
-    if altitude is None:
-        return None
-    if altitude < 300:
-        return "surface"
-    elif altitude < 3000:
-        return "low"
-    else:
-        return "high"
+_recorder_stop = threading.Event()
+_recorder: Optional[threading.Thread] = None
 
 
-def classify_speed(velocity: Optional[float]) -> Optional[str]:
-    if velocity is None:
-        return None
-    if velocity < 140:
-        return "slow"
-    elif velocity < 280:
-        return "fast"
-    else:
-        return "supersonic"
+def record_snapshots(stop: threading.Event, interval: float) -> None:
+    """Keep the replay log and geofences fed while no client is polling"""
+    while not stop.wait(interval):
+        try:
+            current_snapshot()
+        except HTTPException:
+            pass  # Logged by current_snapshot
 
 
-def more_details(aircraft: Optional[Dict[str, Any]]) -> Optional[str]:
-    if not aircraft:
-        return None
+def start_recorder() -> None:
+    global _recorder
+    if settings.snapshot_record_seconds <= 0 or _recorder is not None:
+        return
+    if replay_log is None and not geofence_monitor.zones:
+        return
+    _recorder_stop.clear()
+    _recorder = threading.Thread(
+        target=record_snapshots,
+        args=(_recorder_stop, settings.snapshot_record_seconds),
+        name="snapshot-recorder",
+        daemon=True,
+    )
+    _recorder.start()
 
-    callsign = aircraft.get("callsign")
-    origin_country = aircraft.get("origin_country")
 
-    if not isinstance(callsign, str) or not isinstance(origin_country, str):
-        return None
+def stop_recorder() -> None:
+    global _recorder
+    if _recorder is None:
+        return
+    _recorder_stop.set()
+    _recorder.join()
+    _recorder = None
 
-    return f"This aircraft[{callsign}] from [{origin_country}] and it is civilian aircraft."
 
+def track_client(request: Request) -> None:
+    """Count the client as watching the live picture, drives the polling intervals"""
+    forwarded = request.headers.get("x-forwarded-for", "").split(",")[0].strip()
+    client = forwarded or (request.client.host if request.client else "")
+    poll_scheduler.client_seen(client)
 
-def transform_aircraft(aircraft: Dict[str, Any]) -> TransformedAircraft:
-    true_track_raw = aircraft.get("true_track")
-    try:
-        true_track = int(true_track_raw) if true_track_raw is not None else 0
-    except (ValueError, TypeError):
-        true_track = 0
-
-    transformed: TransformedAircraft = {
-        "id": 0,
-        "aircraftId": aircraft.get("callsign"),
-        "position": convert_to_mgrs(aircraft.get("longitude"), aircraft.get("latitude")),
-        "altitude": classify_altitude(aircraft.get("baro_altitude")),
-        "speed": classify_speed(aircraft.get("velocity")),
-        "direction": true_track,
-        "details": more_details(aircraft),
-        "isExited": bool(aircraft.get("isExited")),
-        "type": "openSky",
-    }
-    return transformed
-
-
-def filter_on_ground(aircraft: Dict[str, Any]) -> bool:
-    # Only aircraft not on ground
-    return not bool(aircraft.get("on_ground"))
-
-
-def transform_practice(aircraft_pc: Dict[str, Any]) -> TransformedAircraft:
-    return {
-        "id": aircraft_pc.get("id", 0),
-        "aircraftId": aircraft_pc.get("aircraftId") or aircraft_pc.get("callsign"),
-        "position": aircraft_pc.get("position"),
-        "altitude": aircraft_pc.get("altitude"),
-        "speed": aircraft_pc.get("speed") or aircraft_pc.get("velocity"),
-        "direction": aircraft_pc.get("direction") or 0,
-        "details": aircraft_pc.get("details"),
-        "isExited": bool(aircraft_pc.get("isExited")),
-        "type": "practiceTool",
-    }
-
-
-def transform_finTraffic_ship(feature: ShipFeature) -> TransformedAircraft:
-    coords = feature.geometry.coordinates
-    props = feature.properties
-
-    return {
-        "id": 0,
-        "aircraftId": str(feature.mmsi),
-        # coordinates[0] is Longitude, coordinates[1] is Latitude
-        "position": convert_to_mgrs(coords[0], coords[1]),
-        "altitude": "surface",
-        "speed": classify_speed(props.sog),
-        "direction": int(props.heading),
-        "details": f"MMSI: {feature.mmsi} | Status: {props.navStat}",
-        "isExited": False,
-        "type": "marineTraffic",
-    }
-
-
-@router.get("/aircraft")
-def get_aircraft_data() -> List[TransformedAircraft]:
+
+LiveClient = Depends(track_client)
+
+
+PrecisionQuery = Query(
+    DEFAULT_PRECISION,
+    ge=MIN_PRECISION,
+    le=MAX_PRECISION,
+    description="MGRS precision, 0 = 100 km, 1 = 10 km ... 5 = 1 m",
+)
+
+
+@router.get("/aircraft", dependencies=[LiveClient])
+def get_aircraft_data(
+    precision: int = PrecisionQuery,
+    bbox: Optional[str] = Query(None, description="lon_min,lat_min,lon_max,lat_max"),
+    near: Optional[str] = Query(None, description="lat,lon, together with radius_km"),
+    radius_km: Optional[float] = Query(None, gt=0),
+    mgrs_prefix: Optional[str] = Query(None, description="Grid zone, 100 km square or cell"),
+) -> List[TransformedAircraft]:
     try:
-        data = fetch_aircraft_data()
-        raw_practice_data = fetch_practice_data()
-        raw_fin_marine_data = fetch_fin_marine_traffic_data()
+        query = parse_query(bbox, near, radius_km, mgrs_prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Transform OpenSky data
-        filtered_data = list(filter(filter_on_ground, data))
-        transformed_aircraft = [transform_aircraft(ac) for ac in filtered_data]
+    snapshot = current_snapshot()
+    if query is None:
+        return snapshot_tracks(snapshot, precision)
+    return snapshot_query(snapshot, precision, query)
 
-        # Transform PracticeTool data
-        transformed_practice = [
-            transform_practice(cast(Dict[str, Any], ac)) for ac in raw_practice_data
-        ]
 
-        # Transform FinMarine data
-        transformed_FinMarine = [transform_finTraffic_ship(ship) for ship in raw_fin_marine_data]
+@router.get("/aircraft/clusters", dependencies=[LiveClient])
+def get_aircraft_clusters(precision: int = PrecisionQuery) -> List[TrackCluster]:
+    """Track counts per MGRS cell for zoomed-out views"""
+    return snapshot_clusters(current_snapshot(), precision)
 
-        return [
-            *transformed_practice,
-            *transformed_aircraft,
-            *transformed_FinMarine,
-        ]
 
-    except Exception as e:
-        logger.error(f"Error retrieving aircraft data: {e}")
-        raise HTTPException(status_code=500, detail="Internal Server Error")
+@router.get("/conflicts", dependencies=[LiveClient])
+def get_conflicts() -> List[Conflict]:
+    """Track pairs within the alert distance, closest projected approach first"""
+    return snapshot_conflicts(current_snapshot())
+
+
+@router.get("/geofence/zones")
+def get_geofence_zones() -> List[GeofenceZone]:
+    return geofence_monitor.zones
+
+
+@router.get("/geofence/events")
+def get_geofence_events(
+    since: int = Query(0, ge=0, description="Only events with id greater than this"),
+    limit: Optional[int] = Query(None, ge=1, description="Return at most this many newest events"),
+) -> List[GeofenceEvent]:
+    # Zones are evaluated when a snapshot is built, cheap when no source is due
+    current_snapshot()
+    return geofence_monitor.events(since=since, limit=limit)
+
+
+def replay_frame_json(timestamp: float, tracks: bytes) -> bytes:
+    # Tracks are already JSON in the log, splice them in instead of decoding and re-encoding
+    return b'{"timestamp":' + json.dumps(timestamp).encode() + b',"tracks":' + tracks + b"}"
+
+
+@router.get("/replay")
+def get_replay(
+    at: Optional[datetime] = Query(None, description="Snapshot that was current at this time"),
+    start: Optional[datetime] = Query(None, alias="from", description="Start of time range"),
+    end: Optional[datetime] = Query(None, alias="to", description="End of time range"),
+) -> Response:
+    if replay_log is None:
+        raise HTTPException(status_code=404, detail="Replay log is not enabled")
+
+    try:
+        if at is not None:
+            frame = replay_log.frame_at(at.timestamp())
+            if frame is None:
+                raise HTTPException(
+                    status_code=404, detail="No snapshot recorded before given time"
+                )
+            return Response(content=replay_frame_json(*frame), media_type="application/json")
+
+        if start is None or end is None:
+            raise HTTPException(status_code=400, detail="Give either at or both from and to")
+        frames = replay_log.frames_between(
+            start.timestamp(), end.timestamp(), settings.replay_max_frames
+        )
+    except (OSError, ValueError, zlib.error) as e:
+        # Missing or damaged segments, e.g. removed by retention or an empty data file
+        logger.error(f"Error reading replay log: {e}")
+        raise HTTPException(status_code=503, detail="Replay log is not available")
+
+    content = b"[" + b",".join(replay_frame_json(*frame) for frame in frames) + b"]"
+    return Response(content=content, media_type="application/json")
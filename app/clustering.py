@@ -0,0 +1,57 @@
+"""Level of detail helpers for MGRS positions"""
+
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from app.schemas.schema import TrackCluster, TransformedAircraft
+
+# MGRS precision digits per axis, 0 = 100 km square ... 5 = 1 m
+MIN_PRECISION = 0
+MAX_PRECISION = 5
+
+
+def truncate_mgrs(position: Optional[str], precision: int) -> Optional[str]:
+    """Reduce MGRS precision, truncating the digits is exactly what a coarser conversion gives"""
+    if not position:
+        return position
+    digits = len(position)
+    while digits > 0 and position[digits - 1].isdigit():
+        digits -= 1
+    easting_northing = position[digits:]
+    half = len(easting_northing) // 2
+    if precision >= half:
+        return position
+    return (
+        position[:digits] + easting_northing[:precision] + easting_northing[half : half + precision]
+    )
+
+
+def with_precision(
+    tracks: Iterable[TransformedAircraft], precision: int
+) -> List[TransformedAircraft]:
+    return [
+        {**track, "position": truncate_mgrs(track.get("position"), precision)} for track in tracks
+    ]
+
+
+def cluster_tracks(tracks: Iterable[TransformedAircraft], precision: int) -> List[TrackCluster]:
+    """Aggregate tracks per MGRS cell into counts by source, altitude class and speed class"""
+    clusters: Dict[str, TrackCluster] = {}
+    for track in tracks:
+        cell = truncate_mgrs(track.get("position"), precision)
+        if not cell:
+            continue
+        cluster = clusters.get(cell)
+        if cluster is None:
+            cluster = clusters[cell] = {
+                "cell": cell,
+                "count": 0,
+                "sources": Counter(),
+                "altitude": Counter(),
+                "speed": Counter(),
+            }
+        cluster["count"] += 1
+        cluster["sources"][track.get("type") or "unknown"] += 1
+        cluster["altitude"][track.get("altitude") or "unknown"] += 1
+        cluster["speed"][track.get("speed") or "unknown"] += 1
+    return sorted(clusters.values(), key=lambda cluster: cluster["cell"])
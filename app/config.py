@@ -1,4 +1,4 @@
-from typing import Optional, Any, Dict, cast
+from typing import Optional, Any, Dict, List, Literal, cast
 from pydantic_settings import BaseSettings
 from pathlib import Path
 import json
@@ -39,6 +39,60 @@ class Settings(BaseSettings):
     practool_port: Optional[int] = None
 
     fin_marine_traffic_api_url: Optional[str] = None
+    # "poll" downloads all locations on every refresh, "stream" follows the MQTT feed
+    fin_marine_ingestion: Literal["poll", "stream"] = "poll"
+    fin_marine_mqtt_url: str = "wss://meri.digitraffic.fi:443/mqtt"
+    fin_marine_mqtt_topic: str = "vessels-v2/+/location"
+    fin_marine_vessel_ttl_seconds: int = 900  # Streamed vessels not heard from are dropped
+
+    # Metadata Enrichment Configuration, tables are kept in enrichment_dir (disabled when unset)
+    enrichment_dir: Optional[str] = None
+    vessel_metadata_api_url: Optional[str] = None
+    aircraft_database_file: Optional[str] = None  # OpenSky aircraftDatabase.csv format
+    enrichment_refresh_seconds: int = 6 * 3600
+
+    # Polling Configuration, sources are fetched again only when their interval has passed
+    adaptive_polling: bool = True  # False fetches every source on every request
+    poll_target_change: float = 0.2  # Share of tracks changed between polls the interval aims at
+    poll_client_window_seconds: int = 60  # Clients seen within the window count as active
+    opensky_daily_credits: int = 4000
+    api_workers: int = 1  # Server processes polling independently, each gets its share of credits
+    opensky_poll_min_seconds: float = 5.0
+    opensky_poll_max_seconds: float = 300.0
+    practool_poll_min_seconds: float = 1.0
+    practool_poll_max_seconds: float = 30.0
+    fin_marine_poll_min_seconds: float = 5.0
+    fin_marine_poll_max_seconds: float = 120.0
+
+    # Transform Configuration
+    transform_workers: int = 0  # Process pool size for snapshot transforms, 0 = inline
+    transform_chunk_size: int = 1000  # Records per pool task
+
+    # Geofence Configuration
+    # GeoJSON FeatureCollection of Polygon features, zones are disabled when unset
+    geofence_zones_file: Optional[str] = None
+    geofence_grid_size: float = 0.1  # Index cell size in degrees
+    geofence_event_limit: int = 1000  # Number of enter/exit events kept in memory
+
+    # Spatial Query Configuration (?bbox=, ?near=, ?mgrs_prefix= on /radar/aircraft)
+    spatial_grid_size: float = 0.25  # Index cell size in degrees
+    spatial_query_cache_size: int = 256  # Filtered results kept, least recently used dropped
+
+    # Conflict Detection Configuration
+    conflict_distance_km: float = 5.0  # Horizontal alert distance
+    conflict_altitude_band_m: float = 300.0  # Pairs further apart vertically are ignored
+    conflict_horizon_seconds: float = 300.0  # How far ahead the closest approach is projected
+    conflict_types: List[str] = ["openSky", "practiceTool"]  # Track sources that are checked
+
+    # Replay Log Configuration, snapshots are not recorded when the directory is unset
+    replay_log_dir: Optional[str] = None
+    replay_segment_max_bytes: int = 64 * 1024 * 1024
+    replay_segment_max_seconds: int = 3600
+    replay_retention_seconds: int = 48 * 3600
+    replay_max_frames: int = 1000  # Max frames returned by one ?from=&to= query
+    # Snapshots are built in the background this often (seconds) when the replay log or
+    # geofences are enabled, sources are still only fetched when due. 0 = only on requests
+    snapshot_record_seconds: float = 5.0
 
 
 settings = Settings()
@@ -0,0 +1,166 @@
+"""Proximity and conflict detection between snapshot tracks
+
+Each track is projected along its speed and track up to the horizon. The area it sweeps,
+widened by half the alert distance, is bucketed into a uniform spatial hash, so only
+tracks whose swept areas share a cell are compared instead of every pair.
+"""
+
+import math
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.schemas.schema import Conflict, TrackPoint
+
+KM_PER_DEGREE = 111.32
+
+
+def velocity_vector(point: TrackPoint) -> Tuple[float, float]:
+    """East and north components in m/s, unknown motion counts as stationary"""
+    if point.velocity is None or point.heading is None:
+        return 0.0, 0.0
+    heading = math.radians(point.heading)
+    return point.velocity * math.sin(heading), point.velocity * math.cos(heading)
+
+
+def relative_position(a: TrackPoint, b: TrackPoint) -> Tuple[float, float]:
+    """East and north offset of b from a in meters"""
+    # Local flat projection around the pair, fine at alert distances
+    km_per_degree_lon = KM_PER_DEGREE * math.cos(math.radians((a.latitude + b.latitude) / 2))
+    return (
+        (b.longitude - a.longitude) * km_per_degree_lon * 1000,
+        (b.latitude - a.latitude) * KM_PER_DEGREE * 1000,
+    )
+
+
+def closest_approach(
+    a: TrackPoint, b: TrackPoint, rx: float, ry: float, horizon_seconds: float
+) -> Tuple[float, float]:
+    """Distance (m) and time (s) of closest approach within the horizon"""
+    ax, ay = velocity_vector(a)
+    bx, by = velocity_vector(b)
+    vx, vy = bx - ax, by - ay
+    speed_squared = vx * vx + vy * vy
+    seconds = 0.0
+    if speed_squared > 0:
+        seconds = min(max(-(rx * vx + ry * vy) / speed_squared, 0.0), horizon_seconds)
+    return math.hypot(rx + vx * seconds, ry + vy * seconds), seconds
+
+
+def swept_box(
+    point: TrackPoint, margin_km: float, cos_min: float, horizon_seconds: float
+) -> Tuple[float, float, float, float]:
+    """Latitude and longitude range the track covers within the horizon, widened by the margin"""
+    vx, vy = velocity_vector(point)
+    cos_lat = max(math.cos(math.radians(point.latitude)), 0.01)
+    end_lat = point.latitude + vy * horizon_seconds / 1000 / KM_PER_DEGREE
+    end_lon = point.longitude + vx * horizon_seconds / 1000 / (KM_PER_DEGREE * cos_lat)
+    margin_lat = margin_km / KM_PER_DEGREE
+    # Degrees of longitude are widest at the highest latitude, the margin covers it everywhere
+    margin_lon = margin_km / (KM_PER_DEGREE * cos_min)
+    return (
+        min(point.latitude, end_lat) - margin_lat,
+        max(point.latitude, end_lat) + margin_lat,
+        min(point.longitude, end_lon) - margin_lon,
+        max(point.longitude, end_lon) + margin_lon,
+    )
+
+
+def cell_pairs(
+    candidates: List[TrackPoint], indices: List[int], altitude_band_m: float
+) -> Iterator[Tuple[int, int]]:
+    """Pairs of tracks in one cell within the altitude band, unknown altitude pairs with any"""
+    known = sorted(
+        (point.altitude, index)
+        for index in indices
+        if (point := candidates[index]).altitude is not None
+    )
+    unknown = [index for index in indices if candidates[index].altitude is None]
+    for position, (altitude, index) in enumerate(known):
+        for other_altitude, other_index in known[position + 1 :]:
+            if other_altitude - altitude > altitude_band_m:
+                break
+            yield index, other_index
+    for position, index in enumerate(unknown):
+        for _, other_index in known:
+            yield index, other_index
+        for other_index in unknown[position + 1 :]:
+            yield index, other_index
+
+
+def detect_conflicts(
+    points: Iterable[TrackPoint],
+    distance_km: float,
+    altitude_band_m: float,
+    horizon_seconds: float,
+    types: Optional[Iterable[str]] = None,
+) -> List[Conflict]:
+    """Pairs of tracks that may come closer than distance_km within the horizon
+
+    Tracks are projected along their current speed and track, a pair conflicts when its
+    closest approach is within the alert distance. The position error of both tracks counts
+    towards the distance, a track known only to the nearest MGRS cell conflicts with anything
+    that could come within the alert distance of some point of that cell.
+    """
+    allowed = set(types) if types is not None else None
+    candidates = [p for p in points if allowed is None or p.type in allowed]
+    if len(candidates) < 2:
+        return []
+
+    # Longitude cells are sized for the highest latitude so they are wide enough everywhere
+    lat_max = max(abs(p.latitude) for p in candidates)
+    cos_min = max(math.cos(math.radians(lat_max)), 0.01)
+    reach_km = distance_km + 2 * max(p.position_error for p in candidates) / 1000
+    # Cells of about half the average swept length keep both the number of cells per track
+    # and the number of tracks per cell low
+    sweep_km = sum(p.velocity or 0.0 for p in candidates) * horizon_seconds / 1000 / len(candidates)
+    cell_km = max(reach_km, sweep_km / 2)
+    cell_lat = cell_km / KM_PER_DEGREE
+    cell_lon = cell_km / (KM_PER_DEGREE * cos_min)
+
+    # Every track is in the cells its swept box covers, two tracks can only come within the
+    # alert distance of each other if their boxes (widened by half of it) overlap
+    grid: Dict[Tuple[int, int], List[int]] = {}
+    corners: List[Tuple[int, int]] = []
+    for index, point in enumerate(candidates):
+        margin_km = distance_km / 2 + point.position_error / 1000
+        lat_low, lat_high, lon_low, lon_high = swept_box(point, margin_km, cos_min, horizon_seconds)
+        row_low, column_low = math.floor(lat_low / cell_lat), math.floor(lon_low / cell_lon)
+        corners.append((row_low, column_low))
+        for row in range(row_low, math.floor(lat_high / cell_lat) + 1):
+            for column in range(column_low, math.floor(lon_high / cell_lon) + 1):
+                grid.setdefault((row, column), []).append(index)
+
+    distance_m = distance_km * 1000
+    conflicts: List[Conflict] = []
+    for cell, indices in grid.items():
+        for first, second in cell_pairs(candidates, indices, altitude_band_m):
+            index, other_index = min(first, second), max(first, second)
+            # Tracks sharing several cells are compared in the first cell both boxes cover
+            if cell != (
+                max(corners[index][0], corners[other_index][0]),
+                max(corners[index][1], corners[other_index][1]),
+            ):
+                continue
+            point, other = candidates[index], candidates[other_index]
+            if other.key == point.key:
+                continue
+            altitude_difference = None
+            if point.altitude is not None and other.altitude is not None:
+                altitude_difference = abs(point.altitude - other.altitude)
+            rx, ry = relative_position(point, other)
+            cpa_distance, cpa_seconds = closest_approach(point, other, rx, ry, horizon_seconds)
+            if cpa_distance - point.position_error - other.position_error > distance_m:
+                continue
+            conflicts.append(
+                {
+                    "trackA": point.key,
+                    "trackB": other.key,
+                    "typeA": point.type,
+                    "typeB": other.type,
+                    "distanceKm": round(math.hypot(rx, ry) / 1000, 3),
+                    "altitudeDifference": altitude_difference,
+                    "cpaDistanceKm": round(cpa_distance / 1000, 3),
+                    "cpaSeconds": round(cpa_seconds, 1),
+                }
+            )
+    conflicts.sort(key=lambda conflict: (conflict["cpaDistanceKm"], conflict["cpaSeconds"]))
+    return conflicts
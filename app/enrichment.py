@@ -0,0 +1,295 @@
+"""Vessel and aircraft metadata joined into the transforms
+
+Metadata is bulk loaded (Digitraffic vessel metadata, offline aircraft database CSV) into
+an open addressing hash table file that is memory-mapped for lookups. A lookup is one hash
+and usually a single probe, and transform pool workers share the same pages.
+"""
+
+import csv
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Mapping, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# magic, slot count, record count, upstream updated (ms), value bytes
+HEADER = struct.Struct("<4sIIQQ")
+SLOT = struct.Struct("<QII")  # key + 1 (0 = empty), value offset, value length
+MAGIC = b"AGM2"
+FIELD_SEPARATOR = "\x1f"
+GOLDEN_RATIO_64 = 0x9E3779B97F4A7C15
+
+VESSEL_FIELDS = ("name", "shipType", "callSign", "destination")
+AIRCRAFT_FIELDS = ("registration", "typecode", "model", "operator")
+
+Record = Tuple[str, ...]
+
+
+def _slot_bits(record_count: int) -> int:
+    # Load factor at most 0.5 keeps linear probing short
+    return max((record_count * 2 - 1).bit_length(), 4)
+
+
+def _home_slot(key: int, bits: int) -> int:
+    return ((key * GOLDEN_RATIO_64) & 0xFFFFFFFFFFFFFFFF) >> (64 - bits)
+
+
+def write_table(filepth: Path, records: Mapping[int, Record], updated_ms: int = 0) -> None:
+    """Write records to a new table file, replacing the old one atomically"""
+    bits = _slot_bits(len(records))
+    slot_count = 1 << bits
+    mask = slot_count - 1
+    slots = bytearray(SLOT.size * slot_count)
+    blob = bytearray()
+    for key, record in records.items():
+        value = FIELD_SEPARATOR.join(record).encode("utf-8")
+        slot = _home_slot(key, bits)
+        while SLOT.unpack_from(slots, slot * SLOT.size)[0]:
+            slot = (slot + 1) & mask
+        SLOT.pack_into(slots, slot * SLOT.size, key + 1, len(blob), len(value))
+        blob += value
+
+    # A private temporary file, refreshes in several worker processes may run at once
+    fd, tmp_name = tempfile.mkstemp(dir=filepth.parent, prefix=f".{filepth.name}.")
+    try:
+        with os.fdopen(fd, "wb") as table_file:
+            table_file.write(HEADER.pack(MAGIC, slot_count, len(records), updated_ms, len(blob)))
+            table_file.write(slots)
+            table_file.write(blob)
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, filepth)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+class MetadataTable:
+    def __init__(self, filepth: Path) -> None:
+        self.path = filepth
+        self.stat = filepth.stat()
+        if self.stat.st_size < HEADER.size:
+            raise ValueError(f"{filepth} is truncated")
+        with filepth.open("rb") as table_file:
+            self._map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slot_count, self.record_count, self.updated_ms, blob_size = HEADER.unpack_from(
+            self._map
+        )
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{filepth} is not a metadata table")
+        self._bits = self.slot_count.bit_length() - 1
+        self._blob_start = HEADER.size + SLOT.size * self.slot_count
+        # Catches a partially written or truncated file before any lookup touches it
+        expected_size = self._blob_start + blob_size
+        power_of_two = self.slot_count and not self.slot_count & (self.slot_count - 1)
+        if not power_of_two or len(self._map) < expected_size:
+            self._map.close()
+            raise ValueError(f"{filepth} is truncated")
+
+    def _value(self, offset: int, length: int) -> Record:
+        start = self._blob_start + offset
+        if start + length > len(self._map):
+            raise ValueError(f"{self.path} is truncated")
+        return tuple(self._map[start : start + length].decode("utf-8").split(FIELD_SEPARATOR))
+
+    def get(self, key: int) -> Optional[Record]:
+        mask = self.slot_count - 1
+        slot = _home_slot(key, self._bits)
+        while True:
+            stored, offset, length = SLOT.unpack_from(self._map, HEADER.size + slot * SLOT.size)
+            if not stored:
+                return None
+            if stored == key + 1:
+                return self._value(offset, length)
+            slot = (slot + 1) & mask
+
+    def items(self) -> Iterator[Tuple[int, Record]]:
+        for slot in range(self.slot_count):
+            stored, offset, length = SLOT.unpack_from(self._map, HEADER.size + slot * SLOT.size)
+            if stored:
+                yield stored - 1, self._value(offset, length)
+
+
+_tables: Dict[str, MetadataTable] = {}
+_tables_checked: Dict[str, float] = {}
+_tables_lock = threading.Lock()
+RELOAD_CHECK_SECONDS = 5.0
+
+
+def table_path(name: str) -> Optional[Path]:
+    if not settings.enrichment_dir:
+        return None
+    return Path(settings.enrichment_dir) / f"{name}.table"
+
+
+def get_table(name: str) -> Optional[MetadataTable]:
+    """Open table, reopened when the file has been replaced by a refresh"""
+    filepth = table_path(name)
+    if filepth is None:
+        return None
+    now = time.monotonic()
+    table = _tables.get(name)
+    if now - _tables_checked.get(name, -RELOAD_CHECK_SECONDS) < RELOAD_CHECK_SECONDS:
+        return table
+
+    with _tables_lock:
+        _tables_checked[name] = now
+        try:
+            stat = filepth.stat()
+        except FileNotFoundError:
+            return table
+        if table is not None and (stat.st_ino, stat.st_mtime_ns) == (
+            table.stat.st_ino,
+            table.stat.st_mtime_ns,
+        ):
+            return table
+        try:
+            # The replaced map is closed by garbage collection once no reader holds it
+            _tables[name] = table = MetadataTable(filepth)
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"Cannot open metadata table {filepth}: {e}")
+        return table
+
+
+def _as_dict(fields: Tuple[str, ...], record: Optional[Record]) -> Optional[Dict[str, str]]:
+    if record is None:
+        return None
+    return {name: value for name, value in zip(fields, record) if value}
+
+
+def lookup(name: str, key: int) -> Optional[Record]:
+    """Record for the key, None when the table is missing or unreadable"""
+    table = get_table(name)
+    if table is None:
+        return None
+    try:
+        return table.get(key)
+    except (struct.error, ValueError) as e:
+        # A damaged table must not fail the transform, it is replaced by the next refresh
+        logger.error(f"Error reading metadata table {table.path}: {e}")
+        return None
+
+
+def vessel_metadata(mmsi: int) -> Optional[Dict[str, str]]:
+    return _as_dict(VESSEL_FIELDS, lookup("vessels", mmsi))
+
+
+def aircraft_metadata(icao24: Optional[str]) -> Optional[Dict[str, str]]:
+    if not icao24:
+        return None
+    try:
+        key = int(icao24, 16)
+    except ValueError:
+        return None
+    return _as_dict(AIRCRAFT_FIELDS, lookup("aircraft", key))
+
+
+def refresh_vessels(filepth: Path) -> None:
+    """Bulk load vessel metadata, only vessels updated since the last load are downloaded"""
+    api_url = settings.vessel_metadata_api_url
+    if not api_url:
+        return
+    records: Dict[int, Record] = {}
+    updated_ms = 0
+    params: Dict[str, int] = {}
+    if filepth.exists():
+        try:
+            current = MetadataTable(filepth)
+            records = dict(current.items())
+            updated_ms = current.updated_ms
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"Reloading all vessel metadata, {filepth} is unreadable: {e}")
+            records, updated_ms = {}, 0
+        if updated_ms:
+            params["from"] = updated_ms
+
+    with httpx.Client(timeout=60.0) as client:
+        response = client.get(api_url, params=params)
+        response.raise_for_status()
+        vessels = response.json()
+
+    for vessel in vessels:
+        try:
+            mmsi = int(vessel["mmsi"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        records[mmsi] = tuple(str(vessel.get(name) or "").strip() for name in VESSEL_FIELDS)
+        updated_ms = max(updated_ms, int(vessel.get("timestamp") or 0))
+
+    write_table(filepth, records, updated_ms)
+    logger.info(f"Vessel metadata: {len(vessels)} updated, {len(records)} total")
+
+
+def refresh_aircraft(filepth: Path) -> None:
+    """Rebuild the aircraft table when the offline database file has changed"""
+    if not settings.aircraft_database_file:
+        return
+    source = Path(settings.aircraft_database_file)
+    if not source.exists():
+        logger.error(f"Aircraft database file {source} not found")
+        return
+    if filepth.exists() and filepth.stat().st_mtime >= source.stat().st_mtime:
+        try:
+            MetadataTable(filepth)
+            return
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"Rebuilding aircraft metadata, {filepth} is unreadable: {e}")
+
+    records: Dict[int, Record] = {}
+    with source.open(encoding="utf-8", newline="") as database:
+        for row in csv.DictReader(database):
+            try:
+                key = int(row.get("icao24") or "", 16)
+            except ValueError:
+                continue
+            records[key] = tuple((row.get(name) or "").strip() for name in AIRCRAFT_FIELDS)
+
+    write_table(filepth, records)
+    logger.info(f"Aircraft metadata: {len(records)} aircraft loaded from {source}")
+
+
+_last_refresh = 0.0
+_refresh_lock = threading.Lock()
+
+
+def refresh_tables() -> None:
+    for name, refresh in (("vessels", refresh_vessels), ("aircraft", refresh_aircraft)):
+        filepth = table_path(name)
+        if filepth is None:
+            return
+        try:
+            filepth.parent.mkdir(parents=True, exist_ok=True)
+            refresh(filepth)
+        except Exception as e:
+            logger.error(f"Error refreshing {name} metadata: {e}")
+
+
+def _refresh_in_background() -> None:
+    try:
+        refresh_tables()
+    finally:
+        _refresh_lock.release()
+
+
+def refresh_if_stale() -> None:
+    """Start a background refresh when the TTL has passed, never blocks the caller"""
+    global _last_refresh
+    if not settings.enrichment_dir:
+        return
+    now = time.monotonic()
+    if _last_refresh and now - _last_refresh < settings.enrichment_refresh_seconds:
+        return
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    _last_refresh = now
+    threading.Thread(target=_refresh_in_background, name="enrichment-refresh", daemon=True).start()
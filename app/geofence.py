@@ -0,0 +1,195 @@
+"""Server-side geofence evaluation for snapshot tracks"""
+
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Literal, Optional, Set, Tuple
+
+from app.config import settings
+from app.schemas.schema import TrackPoint
+from app.schemas.schema_geofence import GeofenceEvent, GeofenceZone
+
+logger = logging.getLogger(__name__)
+
+Cell = Tuple[int, int]
+
+
+def point_in_polygon(longitude: float, latitude: float, polygon: List[List[float]]) -> bool:
+    """Ray casting test, polygon is a list of [longitude, latitude] pairs"""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        xi, yi = polygon[i][0], polygon[i][1]
+        xj, yj = polygon[j][0], polygon[j][1]
+        if (yi > latitude) != (yj > latitude):
+            x_cross = (xj - xi) * (latitude - yi) / (yj - yi) + xi
+            if longitude < x_cross:
+                inside = not inside
+        j = i
+    return inside
+
+
+class GeofenceIndex:
+    """Uniform grid over zone bounding boxes
+
+    Each track only tests the zones registered in its own grid cell, so the cost of a
+    snapshot is proportional to the number of tracks near a zone instead of
+    tracks * zones * vertices.
+    """
+
+    def __init__(self, zones: Iterable[GeofenceZone], grid_size: float) -> None:
+        self.grid_size = grid_size
+        self.zones: List[GeofenceZone] = list(zones)
+        self._bboxes: List[Tuple[float, float, float, float]] = []
+        self._cells: Dict[Cell, List[int]] = {}
+        for zone_index, zone in enumerate(self.zones):
+            lons = [vertex[0] for vertex in zone.polygon]
+            lats = [vertex[1] for vertex in zone.polygon]
+            bbox = (min(lons), min(lats), max(lons), max(lats))
+            self._bboxes.append(bbox)
+            lon_min, lat_min = self._cell(bbox[0], bbox[1])
+            lon_max, lat_max = self._cell(bbox[2], bbox[3])
+            for cell_lon in range(lon_min, lon_max + 1):
+                for cell_lat in range(lat_min, lat_max + 1):
+                    self._cells.setdefault((cell_lon, cell_lat), []).append(zone_index)
+
+    def _cell(self, longitude: float, latitude: float) -> Cell:
+        return (math.floor(longitude / self.grid_size), math.floor(latitude / self.grid_size))
+
+    def zones_containing(self, longitude: float, latitude: float) -> List[GeofenceZone]:
+        candidates = self._cells.get(self._cell(longitude, latitude))
+        if not candidates:
+            return []
+        matches: List[GeofenceZone] = []
+        for zone_index in candidates:
+            lon_min, lat_min, lon_max, lat_max = self._bboxes[zone_index]
+            if not (lon_min <= longitude <= lon_max and lat_min <= latitude <= lat_max):
+                continue
+            zone = self.zones[zone_index]
+            if point_in_polygon(longitude, latitude, zone.polygon):
+                matches.append(zone)
+        return matches
+
+
+def load_zones(filepth: Path) -> List[GeofenceZone]:
+    """Load zones from a GeoJSON FeatureCollection of Polygon features"""
+    raw: Dict[str, Any] = json.loads(filepth.read_text(encoding="utf-8"))
+    zones: List[GeofenceZone] = []
+    for number, feature in enumerate(raw.get("features", [])):
+        try:
+            geometry = feature.get("geometry", {})
+            if geometry.get("type") != "Polygon":
+                logger.warning(f"Skipping geofence feature {number}: not a Polygon")
+                continue
+            props = feature.get("properties") or {}
+            zone_id = str(props.get("id", feature.get("id", number)))
+            zones.append(
+                GeofenceZone(
+                    id=zone_id,
+                    name=str(props.get("name", zone_id)),
+                    polygon=geometry["coordinates"][0],
+                )
+            )
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            logger.warning(f"Skipping malformed geofence feature {number}: {e}")
+    logger.info(f"Loaded {len(zones)} geofence zones from {filepth}")
+    return zones
+
+
+class GeofenceMonitor:
+    """Tracks zone membership between snapshots and records enter/exit events"""
+
+    def __init__(self, zones: Iterable[GeofenceZone], grid_size: float, event_limit: int) -> None:
+        self.index = GeofenceIndex(zones, grid_size)
+        self._inside: Dict[str, Dict[str, TrackPoint]] = {}
+        self._events: Deque[GeofenceEvent] = deque(maxlen=event_limit)
+        self._last_event_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def zones(self) -> List[GeofenceZone]:
+        return self.index.zones
+
+    def _record(
+        self,
+        zone: GeofenceZone,
+        point: TrackPoint,
+        event: Literal["enter", "exit"],
+        timestamp: int,
+    ) -> GeofenceEvent:
+        # Microseconds since the epoch, made strictly increasing. Ids stay ordered across
+        # restarts and are comparable between worker processes, so ?since= keeps its meaning.
+        self._last_event_id = max(self._last_event_id + 1, time.time_ns() // 1000)
+        record: GeofenceEvent = {
+            "id": self._last_event_id,
+            "zoneId": zone.id,
+            "zoneName": zone.name,
+            "trackId": point.key,
+            "type": point.type,
+            "event": event,
+            "latitude": point.latitude,
+            "longitude": point.longitude,
+            "timestamp": timestamp,
+        }
+        self._events.append(record)
+        return record
+
+    def evaluate(
+        self, points: Iterable[TrackPoint], timestamp: Optional[float] = None
+    ) -> List[GeofenceEvent]:
+        """Evaluate one snapshot, returns the events it produced"""
+        if not self.index.zones:
+            return []
+        event_time = int(timestamp if timestamp is not None else time.time())
+
+        current: Dict[str, Dict[str, TrackPoint]] = {}
+        reported_types: Set[str] = set()
+        for point in points:
+            reported_types.add(point.type)
+            for zone in self.index.zones_containing(point.longitude, point.latitude):
+                current.setdefault(zone.id, {})[point.key] = point
+
+        new_events: List[GeofenceEvent] = []
+        with self._lock:
+            for zone in self.index.zones:
+                before = self._inside.get(zone.id, {})
+                now = current.get(zone.id, {})
+                for key, point in now.items():
+                    if key not in before:
+                        new_events.append(self._record(zone, point, "enter", event_time))
+                for key, point in before.items():
+                    if key in now:
+                        continue
+                    if point.type not in reported_types:
+                        # Whole source missing from this snapshot, most likely an upstream
+                        # failure, keep the track inside until the source reports again
+                        now[key] = point
+                        continue
+                    new_events.append(self._record(zone, point, "exit", event_time))
+                self._inside[zone.id] = now
+        return new_events
+
+    def events(self, since: int = 0, limit: Optional[int] = None) -> List[GeofenceEvent]:
+        with self._lock:
+            selected = [event for event in self._events if event["id"] > since]
+        if limit is not None:
+            selected = selected[-limit:]
+        return selected
+
+
+def create_monitor() -> GeofenceMonitor:
+    zones: List[GeofenceZone] = []
+    if settings.geofence_zones_file:
+        filepth = Path(settings.geofence_zones_file)
+        if filepth.exists():
+            zones = load_zones(filepth)
+        else:
+            logger.error(f"Geofence zones file {filepth} not found")
+    return GeofenceMonitor(zones, settings.geofence_grid_size, settings.geofence_event_limit)
+
+
+geofence_monitor = create_monitor()
@@ -0,0 +1,264 @@
+"""Append-only snapshot log for after-action replay
+
+Every published snapshot is stored as one zlib compressed JSON frame. Frames are written to
+segment files that rotate by size and age, each segment has a companion index file of fixed
+size (timestamp, offset, length) records. Reads memory-map the index and binary search it,
+so seeking never parses more than the frames that are actually returned.
+"""
+
+import bisect
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.schemas.schema import TransformedAircraft
+
+logger = logging.getLogger(__name__)
+
+INDEX_RECORD = struct.Struct("<dQI")  # timestamp, data offset, data length
+DATA_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+LOCK_NAME = "replay.lock"
+
+
+@dataclass
+class Segment:
+    start: float
+    data_path: Path
+    index_path: Path
+
+    @property
+    def frame_count(self) -> int:
+        try:
+            # A torn trailing record from a crash is simply ignored
+            return self.index_path.stat().st_size // INDEX_RECORD.size
+        except FileNotFoundError:
+            return 0
+
+    def last_timestamp(self) -> Optional[float]:
+        count = self.frame_count
+        if not count:
+            return None
+        with self.index_path.open("rb") as index_file:
+            index_file.seek((count - 1) * INDEX_RECORD.size)
+            timestamp: float = INDEX_RECORD.unpack(index_file.read(INDEX_RECORD.size))[0]
+            return timestamp
+
+
+def _search(index: mmap.mmap, count: int, timestamp: float, inclusive: bool) -> int:
+    """Number of records before the timestamp, including equal ones when inclusive"""
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        found: float = INDEX_RECORD.unpack_from(index, middle * INDEX_RECORD.size)[0]
+        if found < timestamp or (inclusive and found == timestamp):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _last_frame(segments: List[Segment]) -> Optional[Tuple[float, bytes]]:
+    """Timestamp and compressed data of the newest frame"""
+    for segment in reversed(segments):
+        count = segment.frame_count
+        if not count:
+            continue
+        with segment.index_path.open("rb") as index_file:
+            index_file.seek((count - 1) * INDEX_RECORD.size)
+            timestamp, offset, length = INDEX_RECORD.unpack(index_file.read(INDEX_RECORD.size))
+        with segment.data_path.open("rb") as data_file:
+            data_file.seek(offset)
+            return timestamp, data_file.read(length)
+    return None
+
+
+def _map_index(index_file: BinaryIO, count: int) -> mmap.mmap:
+    return mmap.mmap(index_file.fileno(), count * INDEX_RECORD.size, access=mmap.ACCESS_READ)
+
+
+class ReplayLog:
+    """Replay log shared by every worker process writing to the same directory
+
+    Appends, rotation and expiry hold an exclusive lock on a lock file in the directory and
+    re-read the segment list from disk, reads hold a shared lock. So frames from several
+    processes end up in one ordered sequence and no segment disappears under a reader.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        segment_max_bytes: int,
+        segment_max_seconds: float,
+        retention_seconds: float,
+    ) -> None:
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_seconds = segment_max_seconds
+        self.retention_seconds = retention_seconds
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.directory / LOCK_NAME
+        self.lock_path.touch()
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[List[Segment]]:
+        """Hold the directory lock, yields the segments currently on disk"""
+        # A new open file for every holder, flock then also excludes threads of this process
+        with self.lock_path.open("rb") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield self._scan()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _scan(self) -> List[Segment]:
+        segments: List[Segment] = []
+        for data_path in self.directory.glob(f"*{DATA_SUFFIX}"):
+            try:
+                start = int(data_path.stem) / 1000
+            except ValueError:
+                continue
+            segments.append(Segment(start, data_path, data_path.with_suffix(INDEX_SUFFIX)))
+        segments.sort(key=lambda segment: segment.start)
+        return segments
+
+    def _new_segment(self, timestamp: float) -> Segment:
+        stem = f"{int(timestamp * 1000):016d}"
+        segment = Segment(
+            timestamp,
+            self.directory / f"{stem}{DATA_SUFFIX}",
+            self.directory / f"{stem}{INDEX_SUFFIX}",
+        )
+        segment.data_path.touch()
+        segment.index_path.touch()
+        return segment
+
+    def _active_segment(self, segments: List[Segment], timestamp: float) -> Segment:
+        if segments:
+            segment = segments[-1]
+            too_old = timestamp - segment.start >= self.segment_max_seconds
+            too_big = segment.data_path.stat().st_size >= self.segment_max_bytes
+            if not too_old and not too_big:
+                return segment
+        segment = self._new_segment(timestamp)
+        segments.append(segment)
+        return segment
+
+    def _expire(self, segments: List[Segment], now: float) -> None:
+        cutoff = now - self.retention_seconds
+        # Never remove the active segment
+        while len(segments) > 1:
+            last = segments[0].last_timestamp()
+            if last is not None and last >= cutoff:
+                break
+            expired = segments.pop(0)
+            expired.data_path.unlink(missing_ok=True)
+            expired.index_path.unlink(missing_ok=True)
+            logger.info(f"Removed expired replay segment {expired.data_path.name}")
+
+    def append(self, timestamp: float, tracks: List[TransformedAircraft]) -> bool:
+        """Append a frame, identical consecutive frames are stored only once"""
+        compressed = zlib.compress(json.dumps(tracks, separators=(",", ":")).encode("utf-8"))
+        with self._locked(exclusive=True) as segments:
+            last = _last_frame(segments)
+            if last is not None:
+                last_timestamp, last_compressed = last
+                # Another worker may have recorded the same picture already
+                if compressed == last_compressed:
+                    return False
+                # Another worker already recorded a newer picture
+                if timestamp < last_timestamp:
+                    logger.debug(f"Dropping out of order replay frame at {timestamp}")
+                    return False
+            segment = self._active_segment(segments, timestamp)
+            # Data before index so an index record never points past the written data
+            with segment.data_path.open("ab") as data_file:
+                offset = data_file.seek(0, os.SEEK_END)
+                data_file.write(compressed)
+            with segment.index_path.open("ab") as index_file:
+                index_file.write(INDEX_RECORD.pack(timestamp, offset, len(compressed)))
+            self._expire(segments, timestamp)
+        return True
+
+    def frame_at(self, timestamp: float) -> Optional[Tuple[float, bytes]]:
+        """Latest frame written at or before the timestamp, tracks as raw JSON"""
+        with self._locked(exclusive=False) as segments:
+            starts = [segment.start for segment in segments]
+            for segment in reversed(segments[: bisect.bisect_right(starts, timestamp)]):
+                count = segment.frame_count
+                if not count:
+                    continue
+                with (
+                    segment.index_path.open("rb") as index_file,
+                    _map_index(index_file, count) as index,
+                ):
+                    position = _search(index, count, timestamp, inclusive=True)
+                    if position == 0:
+                        continue
+                    found, offset, length = INDEX_RECORD.unpack_from(
+                        index, (position - 1) * INDEX_RECORD.size
+                    )
+                with segment.data_path.open("rb") as data_file:
+                    data_file.seek(offset)
+                    return found, zlib.decompress(data_file.read(length))
+        return None
+
+    def _frames(
+        self, segment: Segment, first: float, last: float, limit: int
+    ) -> Iterator[Tuple[float, bytes]]:
+        count = segment.frame_count
+        if not count:
+            return
+        with (
+            segment.index_path.open("rb") as index_file,
+            segment.data_path.open("rb") as data_file,
+            _map_index(index_file, count) as index,
+            mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) as data,
+        ):
+            start = _search(index, count, first, inclusive=False)
+            for record in range(start, min(count, start + limit)):
+                timestamp, offset, length = INDEX_RECORD.unpack_from(
+                    index, record * INDEX_RECORD.size
+                )
+                if timestamp > last:
+                    return
+                yield timestamp, zlib.decompress(data[offset : offset + length])
+
+    def frames_between(self, first: float, last: float, limit: int) -> List[Tuple[float, bytes]]:
+        """Frames written between the timestamps (inclusive), tracks as raw JSON"""
+        frames: List[Tuple[float, bytes]] = []
+        with self._locked(exclusive=False) as segments:
+            starts = [segment.start for segment in segments]
+            # Segments that can hold frames at or after the first timestamp
+            for segment in segments[max(bisect.bisect_right(starts, first) - 1, 0) :]:
+                if segment.start > last or len(frames) >= limit:
+                    break
+                frames.extend(self._frames(segment, first, last, limit - len(frames)))
+        return frames
+
+
+def create_replay_log() -> Optional[ReplayLog]:
+    if not settings.replay_log_dir:
+        return None
+    try:
+        return ReplayLog(
+            Path(settings.replay_log_dir),
+            settings.replay_segment_max_bytes,
+            settings.replay_segment_max_seconds,
+            settings.replay_retention_seconds,
+        )
+    except OSError as e:
+        logger.error(f"Cannot open replay log in {settings.replay_log_dir}: {e}")
+        return None
+
+
+replay_log = create_replay_log()
@@ -1,4 +1,4 @@
-from typing import Optional, TypedDict
+from typing import Dict, NamedTuple, Optional, TypedDict
 
 
 class TransformedAircraft(TypedDict, total=False):
@@ -11,3 +11,38 @@ class TransformedAircraft(TypedDict, total=False):
     details: Optional[str]
     isExited: bool
     type: Optional[str]
+
+
+class TrackPoint(NamedTuple):
+    """Position of a transformed track in decimal degrees, before MGRS conversion"""
+
+    track_index: int  # Index of the track in Snapshot.tracks
+    key: str  # Stable identifier of the track, "<type>:<id>"
+    type: str
+    latitude: float
+    longitude: float
+    altitude: Optional[float] = None  # Meters
+    velocity: Optional[float] = None  # Meters per second
+    heading: Optional[float] = None  # Degrees clockwise from north
+    position_error: float = 0.0  # Meters, the true position is within this radius
+
+
+class TrackCluster(TypedDict):
+    """Tracks aggregated into one MGRS grid cell"""
+
+    cell: str
+    count: int
+    sources: Dict[str, int]
+    altitude: Dict[str, int]
+    speed: Dict[str, int]
+
+
+class Conflict(TypedDict):
+    trackA: str
+    trackB: str
+    typeA: str
+    typeB: str
+    distanceKm: float
+    altitudeDifference: Optional[float]  # Meters, None when either altitude is unknown
+    cpaDistanceKm: float  # Closest point of approach from current velocity and track
+    cpaSeconds: float
@@ -0,0 +1,24 @@
+from typing import List, Literal, TypedDict
+
+from pydantic import BaseModel, Field
+
+
+class GeofenceZone(BaseModel):
+    """Restricted area evaluated against every snapshot"""
+
+    id: str = Field(..., description="Unique zone identifier")
+    name: str = Field(..., description="Human readable zone name")
+    # Outer ring as [longitude, latitude] pairs, same order as GeoJSON
+    polygon: List[List[float]] = Field(..., min_length=3, description="Polygon outer ring")
+
+
+class GeofenceEvent(TypedDict):
+    id: int
+    zoneId: str
+    zoneName: str
+    trackId: str
+    type: str
+    event: Literal["enter", "exit"]
+    latitude: float
+    longitude: float
+    timestamp: int
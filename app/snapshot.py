@@ -0,0 +1,48 @@
+"""Merged picture of all sources as published by /radar/aircraft"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, TypeVar
+
+from app.schemas.schema import TrackPoint, TransformedAircraft
+
+T = TypeVar("T")
+
+_versions = itertools.count(1)
+
+
+def next_version() -> int:
+    return next(_versions)
+
+
+@dataclass
+class Snapshot:
+    tracks: List[TransformedAircraft]
+    # Positions of the tracks that had coordinates, TrackPoint.track_index refers to tracks
+    points: List[TrackPoint]
+    version: int = field(default_factory=next_version)
+    timestamp: float = field(default_factory=time.time)
+    # Derived views (other precisions, clusters...) computed at most once per snapshot
+    _views: Dict[Hashable, Future[Any]] = field(default_factory=dict, repr=False)
+    _views_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def cached(self, key: Hashable, factory: Callable[[], T]) -> T:
+        # Computed outside the lock, a slow view does not hold up the others
+        with self._views_lock:
+            entry = self._views.get(key)
+            computing = entry is None
+            if entry is None:
+                entry = self._views[key] = Future()
+        if computing:
+            try:
+                entry.set_result(factory())
+            except BaseException as e:
+                with self._views_lock:
+                    del self._views[key]
+                entry.set_exception(e)
+                raise
+        view: T = entry.result()
+        return view
@@ -0,0 +1,236 @@
+"""Area of interest filters for /radar/aircraft
+
+A grid index over the track points is built once per snapshot and a query only visits the
+cells its area overlaps. MGRS prefix queries go through the 100 km square of each track.
+Filtered results are kept in an LRU cache keyed by snapshot version and query.
+"""
+
+import math
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+from app.clustering import MAX_PRECISION, truncate_mgrs
+from app.config import settings
+from app.conflict import KM_PER_DEGREE
+from app.schemas.schema import TrackPoint, TransformedAircraft
+
+T = TypeVar("T")
+
+EARTH_RADIUS_KM = 6371.0088
+SQUARE = re.compile(r"\d{1,2}[A-Z]{3}")
+MGRS_PREFIX = re.compile(rf"\d{{1,2}}[A-Z]{{1,2}}|\d{{1,2}}[A-Z]{{3}}(?:\d\d){{0,{MAX_PRECISION}}}")
+
+BBox = Tuple[float, float, float, float]  # lon_min, lat_min, lon_max, lat_max
+
+
+class Near(NamedTuple):
+    latitude: float
+    longitude: float
+    radius_km: float
+
+
+class SpatialQuery(NamedTuple):
+    bbox: Optional[BBox] = None
+    near: Optional[Near] = None
+    mgrs_prefix: Optional[str] = None
+
+
+def parse_floats(value: str, count: int, name: str) -> List[float]:
+    try:
+        numbers = [float(part) for part in value.split(",")]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(math.isfinite(number) for number in numbers):
+        raise ValueError(f"{name} must be {count} comma separated numbers")
+    return numbers
+
+
+def parse_query(
+    bbox: Optional[str],
+    near: Optional[str],
+    radius_km: Optional[float],
+    mgrs_prefix: Optional[str],
+) -> Optional[SpatialQuery]:
+    """Validated query, None when no filter was given. Raises ValueError on bad input."""
+    query = SpatialQuery()
+    if bbox is not None:
+        lon_min, lat_min, lon_max, lat_max = parse_floats(bbox, 4, "bbox")
+        if lon_min > lon_max or lat_min > lat_max:
+            raise ValueError("bbox must be lon_min,lat_min,lon_max,lat_max")
+        query = query._replace(bbox=(lon_min, lat_min, lon_max, lat_max))
+    if near is not None:
+        if radius_km is None:
+            raise ValueError("near requires radius_km")
+        latitude, longitude = parse_floats(near, 2, "near")
+        if not -90 <= latitude <= 90:
+            raise ValueError("near latitude must be between -90 and 90")
+        query = query._replace(near=Near(latitude, longitude, radius_km))
+    if mgrs_prefix is not None:
+        prefix = mgrs_prefix.replace(" ", "").upper()
+        if not MGRS_PREFIX.fullmatch(prefix):
+            raise ValueError("mgrs_prefix must be a grid zone, 100 km square or square with digits")
+        query = query._replace(mgrs_prefix=prefix)
+    if query == SpatialQuery():
+        return None
+    return query
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+class SpatialIndex:
+    def __init__(
+        self, tracks: List[TransformedAircraft], points: List[TrackPoint], cell_size: float
+    ) -> None:
+        self.tracks = tracks
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[TrackPoint]] = {}
+        for point in points:
+            self.cells.setdefault(self._cell(point.latitude, point.longitude), []).append(point)
+        self.squares: Dict[str, List[int]] = {}
+        for index, track in enumerate(tracks):
+            position = track.get("position")
+            square = SQUARE.match(position) if position else None
+            if square:
+                self.squares.setdefault(square.group(), []).append(index)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def _points_in_bbox(self, bbox: BBox) -> Iterator[TrackPoint]:
+        lon_min, lat_min, lon_max, lat_max = bbox
+        row_min, column_min = self._cell(lat_min, lon_min)
+        row_max, column_max = self._cell(lat_max, lon_max)
+        if (row_max - row_min + 1) * (column_max - column_min + 1) <= len(self.cells):
+            cells = (
+                self.cells.get((row, column), [])
+                for row in range(row_min, row_max + 1)
+                for column in range(column_min, column_max + 1)
+            )
+        else:
+            # The box covers more cells than there are occupied ones
+            cells = (
+                points
+                for (row, column), points in self.cells.items()
+                if row_min <= row <= row_max and column_min <= column <= column_max
+            )
+        for points in cells:
+            for point in points:
+                if lat_min <= point.latitude <= lat_max and lon_min <= point.longitude <= lon_max:
+                    yield point
+
+    def in_bbox(self, bbox: BBox) -> Set[int]:
+        return {point.track_index for point in self._points_in_bbox(bbox)}
+
+    def near(self, near: Near) -> Set[int]:
+        lat_span = near.radius_km / KM_PER_DEGREE
+        # Degrees of longitude are shortest at the edge of the circle closest to the pole
+        widest = min(abs(near.latitude) + lat_span, 89.0)
+        lon_span = near.radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+        bbox = (
+            near.longitude - lon_span,
+            near.latitude - lat_span,
+            near.longitude + lon_span,
+            near.latitude + lat_span,
+        )
+        return {
+            point.track_index
+            for point in self._points_in_bbox(bbox)
+            if distance_km(near.latitude, near.longitude, point.latitude, point.longitude)
+            <= near.radius_km
+        }
+
+    def with_mgrs_prefix(self, prefix: str) -> Set[int]:
+        square = SQUARE.match(prefix)
+        if square is None:
+            # Grid zone or partial square, every square under it matches
+            return {
+                index
+                for key, indices in self.squares.items()
+                if key.startswith(prefix)
+                for index in indices
+            }
+        indices = self.squares.get(square.group(), [])
+        digits = prefix[square.end() :]
+        if not digits:
+            return set(indices)
+        precision = len(digits) // 2
+        return {
+            index
+            for index in indices
+            if truncate_mgrs(self.tracks[index].get("position"), precision) == prefix
+        }
+
+    def query(self, query: SpatialQuery) -> List[int]:
+        """Indices of the tracks matching every given filter, in snapshot order"""
+        matches: Optional[Set[int]] = None
+        if query.mgrs_prefix is not None:
+            matches = self.with_mgrs_prefix(query.mgrs_prefix)
+        if query.bbox is not None:
+            found = self.in_bbox(query.bbox)
+            matches = found if matches is None else matches & found
+        if query.near is not None:
+            found = self.near(query.near)
+            matches = found if matches is None else matches & found
+        return sorted(matches or ())
+
+
+class QueryCache:
+    """Least recently used results, keys include the snapshot version so old entries age out
+
+    Results are computed outside the lock, requests for a key being computed wait for that
+    result while other keys are served meanwhile.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict[Hashable, Future[Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, factory: Callable[[], T]) -> T:
+        with self._lock:
+            entry = self._entries.get(key)
+            computing = entry is None
+            if entry is None:
+                entry = self._entries[key] = Future()
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+
+        if computing:
+            try:
+                entry.set_result(factory())
+            except BaseException as e:
+                # Not cached, the next request tries again
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                entry.set_exception(e)
+                raise
+        value: T = entry.result()
+        return value
+
+
+query_cache = QueryCache(settings.spatial_query_cache_size)
@@ -0,0 +1,213 @@
+"""Streaming AIS ingestion from Digitraffic MQTT
+
+Location updates (topic vessels-v2/<mmsi>/location) are applied to an in-memory table keyed
+by MMSI as they arrive. Vessels outside the bounding box are dropped on arrival and vessels
+that stop reporting are evicted after a TTL.
+"""
+
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.enums import CallbackAPIVersion
+from paho.mqtt.properties import Properties
+from paho.mqtt.reasoncodes import ReasonCode
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def location_to_feature(mmsi: int, location: Dict[str, Any]) -> Dict[str, Any]:
+    """Digitraffic MQTT location message to the GeoJSON feature shape of the REST API"""
+    epoch = int(location["time"])
+    return {
+        "mmsi": mmsi,
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [location["lon"], location["lat"]]},
+        "properties": {
+            "mmsi": mmsi,
+            "sog": location["sog"],
+            "cog": location["cog"],
+            "navStat": location["navStat"],
+            "rot": location.get("rot"),
+            "posAcc": location["posAcc"],
+            "raim": location["raim"],
+            "heading": location["heading"],
+            "timestamp": epoch % 60,
+            "timestampExternal": epoch * 1000,
+        },
+    }
+
+
+class VesselTable:
+    """Latest feature per MMSI, ordered by receive time so eviction only touches expired rows"""
+
+    def __init__(self, ttl_seconds: float, bbox: Tuple[float, float, float, float]) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.lat_min, self.lat_max, self.lon_min, self.lon_max = bbox
+        self._vessels: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._vessels)
+
+    def in_bbox(self, latitude: float, longitude: float) -> bool:
+        return (
+            self.lat_min <= latitude <= self.lat_max and self.lon_min <= longitude <= self.lon_max
+        )
+
+    def update(self, feature: Dict[str, Any], now: Optional[float] = None) -> None:
+        received = time.monotonic() if now is None else now
+        mmsi = int(feature["mmsi"])
+        longitude, latitude = feature["geometry"]["coordinates"][:2]
+        with self._lock:
+            if not self.in_bbox(latitude, longitude):
+                # Left the area
+                self._vessels.pop(mmsi, None)
+                return
+            self._vessels[mmsi] = (received, feature)
+            self._vessels.move_to_end(mmsi)
+
+    def evict(self, now: Optional[float] = None) -> int:
+        cutoff = (time.monotonic() if now is None else now) - self.ttl_seconds
+        evicted = 0
+        with self._lock:
+            while self._vessels:
+                mmsi, (received, _) = next(iter(self._vessels.items()))
+                if received >= cutoff:
+                    break
+                del self._vessels[mmsi]
+                evicted += 1
+        return evicted
+
+    def features(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        self.evict(now)
+        with self._lock:
+            return [feature for _, feature in self._vessels.values()]
+
+
+class MarineStream:
+    """Follows the MQTT location feed over WebSocket, reconnecting with backoff"""
+
+    def __init__(self, table: VesselTable, url: str, topic: str, keepalive: int = 60) -> None:
+        self.table = table
+        self.url = urlparse(url)
+        self.topic = topic
+        self.keepalive = keepalive
+        # Set once the broker has accepted the subscription
+        self.subscribed = threading.Event()
+        self.client = mqtt.Client(
+            CallbackAPIVersion.VERSION2,
+            client_id=f"airguardian-{uuid.uuid4().hex[:12]}",
+            transport="websockets",
+        )
+        self.client.ws_set_options(path=self.url.path or "/mqtt")
+        if self.url.scheme == "wss":
+            self.client.tls_set()
+        self.client.reconnect_delay_set(min_delay=1, max_delay=60)
+        self.client.on_connect = self._on_connect
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _on_connect(
+        self,
+        client: mqtt.Client,
+        userdata: Any,
+        flags: mqtt.ConnectFlags,
+        reason_code: ReasonCode,
+        properties: Optional[Properties],
+    ) -> None:
+        if reason_code.is_failure:
+            logger.error(f"MQTT connection to {self.url.geturl()} refused: {reason_code}")
+            return
+        logger.info(f"Connected to MQTT broker {self.url.geturl()}")
+        # Subscribed again on every reconnect, the session is not persistent
+        client.subscribe(self.topic)
+
+    def _on_subscribe(
+        self,
+        client: mqtt.Client,
+        userdata: Any,
+        mid: int,
+        reason_codes: List[ReasonCode],
+        properties: Optional[Properties],
+    ) -> None:
+        failed = [code for code in reason_codes if code.is_failure]
+        if failed:
+            # Otherwise a rejected subscription looks like a healthy stream without data
+            logger.error(f"MQTT subscription to {self.topic} rejected: {failed[0]}")
+            return
+        self.subscribed.set()
+
+    def _on_disconnect(
+        self,
+        client: mqtt.Client,
+        userdata: Any,
+        flags: mqtt.DisconnectFlags,
+        reason_code: ReasonCode,
+        properties: Optional[Properties],
+    ) -> None:
+        self.subscribed.clear()
+        logger.warning(f"MQTT connection to {self.url.geturl()} lost: {reason_code}")
+
+    def _on_message(self, client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage) -> None:
+        self.handle_message(message.topic, message.payload)
+
+    def handle_message(self, topic: str, payload: bytes) -> None:
+        parts = topic.split("/")
+        if len(parts) != 3 or parts[2] != "location":
+            return
+        try:
+            feature = location_to_feature(int(parts[1]), json.loads(payload))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.debug(f"Skipping malformed AIS message on {topic}: {e}")
+            return
+        self.table.update(feature)
+
+    def start(self, seed: Callable[[], Optional[List[Dict[str, Any]]]]) -> None:
+        """Start streaming, the table is first filled from one full download"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        # Without a seed the table fills up from the stream alone
+        for feature in seed() or []:
+            try:
+                self.table.update(feature)
+            except (KeyError, TypeError, ValueError) as e:
+                logger.debug(f"Skipping malformed seed feature: {e}")
+        logger.info(f"Seeded vessel table with {len(self.table)} vessels")
+        default_port = 443 if self.url.scheme == "wss" else 80
+        self.client.connect_async(
+            self.url.hostname or "", self.url.port or default_port, self.keepalive
+        )
+        # Background network thread, retries the first connection as well
+        self.client.loop_start()
+
+    def stop(self) -> None:
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+@functools.cache
+def get_marine_stream() -> MarineStream:
+    """The process wide stream, created on first use so poll mode never sets up a client"""
+    return MarineStream(
+        VesselTable(
+            settings.fin_marine_vessel_ttl_seconds,
+            (settings.lat_min, settings.lat_max, settings.lon_min, settings.lon_max),
+        ),
+        settings.fin_marine_mqtt_url,
+        settings.fin_marine_mqtt_topic,
+    )
@@ -1,13 +1,29 @@
 import logging
+from typing import Any, Dict, Optional
+
 import httpx
 from app.config import settings
-from app.schemas.schema_marine_traffic import ShipFeature
+from app.tasks.marine_stream_task import get_marine_stream
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def fetch_fin_marine_traffic_data() -> list[ShipFeature]:
+def fetch_fin_marine_traffic_data() -> Optional[list[Dict[str, Any]]]:
+    """GeoJSON ship features inside the bounding box, None when the download failed
+
+    Features are returned as raw dicts, ShipFeature validation is part of the transform stage.
+    """
+    if settings.fin_marine_ingestion == "stream":
+        # Marine fetches are serialized by the poll scheduler, one stream per process
+        marine_stream = get_marine_stream()
+        marine_stream.start(seed=fetch_fin_marine_locations)
+        return marine_stream.table.features()
+    return fetch_fin_marine_locations()
+
+
+def fetch_fin_marine_locations() -> Optional[list[Dict[str, Any]]]:
+    """Download the full Digitraffic locations dump and filter it to the bounding box"""
     api_url = settings.fin_marine_traffic_api_url
     if not api_url:
         logger.warning("FinMarine API URL is not configured.")
@@ -25,7 +41,7 @@ def fetch_fin_marine_traffic_data() -> list[ShipFeature]:
             raw = response.json()
             features = raw.get("features", [])
 
-            filtered_features: list[ShipFeature] = []
+            filtered_features: list[Dict[str, Any]] = []
 
             for f in features:
                 try:
@@ -37,7 +53,7 @@ def fetch_fin_marine_traffic_data() -> list[ShipFeature]:
                     lat: float = coords[1]
 
                     if lamin <= lat <= lamax and lomin <= lon <= lomax:
-                        filtered_features.append(ShipFeature(**f))
+                        filtered_features.append(f)
                 except (KeyError, TypeError, ValueError) as e:
                     logger.debug(f"Skipping malformed feature: {e}")
                     continue
@@ -52,4 +68,4 @@ def fetch_fin_marine_traffic_data() -> list[ShipFeature]:
     except Exception as e:
         logger.error(f"Unexpected error parsing FinMarine data: {e}")
 
-    return []
+    return None
@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 
 import httpx
 
@@ -9,7 +10,8 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def fetch_practice_data() -> list[TransformedAircraft]:
+def fetch_practice_data() -> Optional[list[TransformedAircraft]]:
+    """Practice tool tracks, None when the practice tool could not be read"""
     if not settings.practool_host or not settings.practool_port:
         return []
 
@@ -26,7 +28,7 @@ def fetch_practice_data() -> list[TransformedAircraft]:
 
     except httpx.HTTPError as e:
         logger.error(f"HTTP error occurred: {e}")
-        return []
+        return None
     except Exception as e:
         logger.error(f"Unexpected error fetching Practice data: {e}")
-        return []
+        return None
@@ -6,6 +6,9 @@ from app.opensky_auth import get_auth_headers
 
 logger = logging.getLogger(__name__)
 
+# Credits left today as reported by the last OpenSky response, None until known
+credits_remaining: Optional[int] = None
+
 
 def build_opensky_url() -> str:
     base_url = settings.opensky_api_url.rstrip("/")
@@ -18,26 +21,43 @@ def build_opensky_url() -> str:
     )
 
 
-def fetch_opensky_data() -> Dict[str, Any]:
+def opensky_request_credits() -> int:
+    """Credits one /states/all request costs, by the area of the bounding box"""
+    area = (settings.lat_max - settings.lat_min) * (settings.lon_max - settings.lon_min)
+    if area <= 25:
+        return 1
+    if area <= 100:
+        return 2
+    if area <= 400:
+        return 3
+    return 4
+
+
+def fetch_opensky_data() -> Optional[Dict[str, Any]]:
+    """Decoded /states/all response, None when the request failed"""
+    global credits_remaining
     url = build_opensky_url()
     headers = get_auth_headers()
     if not headers:
         logger.error("No auth headers, cannot fetch OpenSky data")
-        return {}
+        return None
 
     try:
         with httpx.Client(timeout=10.0) as client:
             resp = client.get(url, headers=headers)
+            remaining = resp.headers.get("X-Rate-Limit-Remaining")
+            if remaining is not None and remaining.isdigit():
+                credits_remaining = int(remaining)
             resp.raise_for_status()
             data = resp.json()
             if not isinstance(data, dict):
                 logger.error("OpenSky API returned unexpected data (not a dict)")
-                return {}
+                return None
             # Cast to Dict[str, Any] after runtime check
             return cast(Dict[str, Any], data)
     except Exception as e:
         logger.error(f"Error fetching OpenSky data: {e}")
-        return {}
+        return None
 
 
 def extract_required_fields(states: List[List[Optional[Any]]]) -> List[Dict[str, Any]]:
@@ -64,15 +84,17 @@ def extract_required_fields(states: List[List[Optional[Any]]]) -> List[Dict[str,
     return aircraft_list
 
 
-def fetch_aircraft_data() -> List[Dict[str, Any]]:
+def fetch_aircraft_data() -> Optional[List[Dict[str, Any]]]:
+    """Aircraft in the bounding box, None when OpenSky could not be read"""
     logger.info("Starting fetch_aircraft_data task...")
-    data: Dict[str, Any] = fetch_opensky_data()
+    data = fetch_opensky_data()
 
-    if not data or "states" not in data:
+    if data is None or "states" not in data:
         logger.warning("No data received from OpenSky API")
-        return []
+        return None
 
-    states = data.get("states", [])
+    # "states" is null when there are no aircraft in the box
+    states = data.get("states") or []
     aircraft_list = extract_required_fields(states)
 
     logger.info(f"Processed {len(aircraft_list)} aircraft in Finland out of {len(states)} total")
@@ -0,0 +1,279 @@
+"""Adaptive polling of the upstream sources
+
+A source is fetched again only when its refresh interval has passed, until then the previous
+result is served. The interval follows the share of tracks that changed between consecutive
+results, is shortened when more clients are watching and never spends a credit budget faster
+than what is left of the day allows. A failed fetch keeps the previous result, costs no
+credits and is retried after the minimum interval.
+
+Each server process polls on its own, so the daily credits are split evenly between the
+API_WORKERS processes.
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, Hashable, List, Optional
+
+from app.config import settings
+from app.tasks import radar_task
+from app.transform import DEFAULT_PRECISION, classify_altitude, classify_speed, convert_to_mgrs
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 24 * 3600
+MAX_STEP = 2.0  # The interval changes at most by this factor per poll
+
+Fingerprint = Callable[[List[Any]], FrozenSet[Hashable]]
+# Fetch functions return None when the upstream could not be read
+Fetch = Callable[[], Optional[List[Any]]]
+
+
+def change_ratio(previous: FrozenSet[Hashable], current: FrozenSet[Hashable]) -> float:
+    """Share of tracks that appeared, disappeared or moved between two results"""
+    total = len(previous) + len(current)
+    if not total:
+        return 0.0
+    # A moved track is in both differences, so is a track in both totals
+    return len(previous ^ current) / total
+
+
+class CreditBudget:
+    """Daily credit allowance (UTC days)
+
+    Credits are paced at the flat daily rate, credits saved by polling less than that
+    (quiet hours) can be spent faster later on, as long as what is left still covers the
+    rest of the day at the flat rate.
+    """
+
+    def __init__(
+        self,
+        daily_credits: int,
+        cost: Callable[[], int],
+        reported_remaining: Optional[Callable[[], Optional[int]]] = None,
+    ) -> None:
+        self.daily_credits = daily_credits
+        self.cost = cost
+        self.reported_remaining = reported_remaining
+        self.spent = 0
+        self.reported: Optional[int] = None
+        self._day = 0
+
+    def _roll_over(self, now: float) -> None:
+        day = int(now // DAY_SECONDS)
+        if day != self._day:
+            self._day = day
+            self.spent = 0
+            self.reported = None
+
+    def remaining(self, now: float) -> int:
+        self._roll_over(now)
+        remaining = self.daily_credits - self.spent
+        if self.reported is not None:
+            # The upstream count also covers other users of the same key
+            remaining = min(remaining, self.reported)
+        return remaining
+
+    def spend(self, now: float) -> None:
+        self._roll_over(now)
+        self.spent += self.cost()
+        if self.reported_remaining is not None:
+            self.reported = self.reported_remaining()
+
+    def saved(self, now: float) -> float:
+        """Credits left beyond what the flat rate needs for the rest of the day"""
+        seconds_left = DAY_SECONDS - now % DAY_SECONDS
+        return self.remaining(now) - self.daily_credits * seconds_left / DAY_SECONDS
+
+    def min_interval(self, now: float) -> float:
+        seconds_left = DAY_SECONDS - now % DAY_SECONDS
+        remaining = self.remaining(now)
+        cost = self.cost()
+        if remaining < cost:
+            return seconds_left
+        if self.saved(now) >= cost:
+            # Ahead of the flat rate, the poll interval alone decides
+            return 0.0
+        return seconds_left * cost / remaining
+
+
+@dataclass
+class PollPolicy:
+    min_seconds: float
+    max_seconds: float
+    fingerprint: Fingerprint
+    budget: Optional[CreditBudget] = None
+
+
+@dataclass
+class Polled:
+    records: List[Any]
+    generation: int  # Increases on every fetch, equal generations mean the same records
+
+
+class SourcePoller:
+    def __init__(self, name: str, policy: PollPolicy) -> None:
+        self.name = name
+        self.policy = policy
+        self.interval = policy.min_seconds  # Adapted to the change rate, before demand and budget
+        self.fetched_at = 0.0
+        self.failed = False  # The last fetch failed, retried after the minimum interval
+        self.result: Optional[Polled] = None
+        self._fingerprint: FrozenSet[Hashable] = frozenset()
+        self._lock = threading.Lock()
+
+    def effective_interval(self, now: float, clients: int) -> float:
+        demand = 1 + math.log2(max(clients, 1))
+        interval = min(
+            max(self.interval / demand, self.policy.min_seconds), self.policy.max_seconds
+        )
+        if self.policy.budget is not None:
+            interval = max(interval, self.policy.budget.min_interval(now))
+        return interval
+
+    def due(self, now: float, clients: int) -> bool:
+        if self.failed:
+            return now - self.fetched_at >= self.policy.min_seconds
+        return self.result is None or now - self.fetched_at >= self.effective_interval(now, clients)
+
+    def poll(self, fetch: Fetch, clients: int, now: Optional[float] = None) -> Polled:
+        # Concurrent requests wait for the fetch in progress instead of starting their own
+        with self._lock:
+            now = time.time() if now is None else now
+            if settings.adaptive_polling and not self.due(now, clients):
+                return self.result or Polled([], 0)
+
+            records = fetch()
+            self.fetched_at = now
+            self.failed = records is None
+            if records is None:
+                logger.warning(f"{self.name}: fetch failed, retrying in {self.policy.min_seconds}s")
+                # Generation 0 is nothing fetched yet, never mistaken for a successful result
+                return self.result or Polled([], 0)
+            if self.policy.budget is not None:
+                self.policy.budget.spend(now)
+            self._adapt(records)
+            generation = self.result.generation + 1 if self.result is not None else 1
+            self.result = Polled(records, generation)
+            return self.result
+
+    def _adapt(self, records: List[Any]) -> None:
+        fingerprint = self.policy.fingerprint(records)
+        if self.result is not None:
+            change = change_ratio(self._fingerprint, fingerprint)
+            step = MAX_STEP if change <= 0 else settings.poll_target_change / change
+            step = min(max(step, 1 / MAX_STEP), MAX_STEP)
+            self.interval = min(
+                max(self.interval * step, self.policy.min_seconds), self.policy.max_seconds
+            )
+            logger.debug(f"{self.name}: {change:.0%} changed, interval {self.interval:.1f}s")
+        self._fingerprint = fingerprint
+
+
+class ClientTracker:
+    """Clients that requested the live picture within the window"""
+
+    def __init__(self, window_seconds: float) -> None:
+        self.window_seconds = window_seconds
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, client: str, now: Optional[float] = None) -> None:
+        with self._lock:
+            self._seen[client] = time.time() if now is None else now
+            self._seen.move_to_end(client)
+
+    def active(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            # Oldest first, stop at the first client still inside the window
+            while self._seen:
+                client, last_seen = next(iter(self._seen.items()))
+                if now - last_seen < self.window_seconds:
+                    break
+                del self._seen[client]
+            return len(self._seen)
+
+
+class PollScheduler:
+    def __init__(self, policies: Dict[str, PollPolicy], client_window_seconds: float) -> None:
+        self.policies = policies
+        self.client_window_seconds = client_window_seconds
+        self.reset()
+
+    def reset(self) -> None:
+        self.sources = {name: SourcePoller(name, policy) for name, policy in self.policies.items()}
+        self.clients = ClientTracker(self.client_window_seconds)
+
+    def client_seen(self, client: str) -> None:
+        self.clients.seen(client)
+
+    def poll(self, name: str, fetch: Fetch) -> Polled:
+        return self.sources[name].poll(fetch, self.clients.active())
+
+
+def opensky_fingerprint(aircraft: List[Any]) -> FrozenSet[Hashable]:
+    """Aircraft as clients see them by default, movement inside an MGRS cell is no change"""
+    return frozenset(
+        (
+            a.get("icao24"),
+            convert_to_mgrs(a.get("longitude"), a.get("latitude"), DEFAULT_PRECISION),
+            classify_altitude(a.get("baro_altitude")),
+            classify_speed(a.get("velocity")),
+        )
+        for a in aircraft
+    )
+
+
+def practice_fingerprint(tracks: List[Any]) -> FrozenSet[Hashable]:
+    return frozenset(
+        (t.get("id") or t.get("aircraftId"), t.get("position"), t.get("altitude")) for t in tracks
+    )
+
+
+def marine_fingerprint(features: List[Any]) -> FrozenSet[Hashable]:
+    return frozenset(
+        (f.get("mmsi"), tuple((f.get("geometry") or {}).get("coordinates") or ())) for f in features
+    )
+
+
+def opensky_reported_share() -> Optional[int]:
+    """Credits OpenSky reports left for the key, divided between the server processes"""
+    if radar_task.credits_remaining is None:
+        return None
+    return radar_task.credits_remaining // max(settings.api_workers, 1)
+
+
+def create_scheduler() -> PollScheduler:
+    opensky_budget = CreditBudget(
+        settings.opensky_daily_credits // max(settings.api_workers, 1),
+        radar_task.opensky_request_credits,
+        opensky_reported_share,
+    )
+    return PollScheduler(
+        {
+            "openSky": PollPolicy(
+                settings.opensky_poll_min_seconds,
+                settings.opensky_poll_max_seconds,
+                opensky_fingerprint,
+                opensky_budget,
+            ),
+            "practiceTool": PollPolicy(
+                settings.practool_poll_min_seconds,
+                settings.practool_poll_max_seconds,
+                practice_fingerprint,
+            ),
+            "marineTraffic": PollPolicy(
+                settings.fin_marine_poll_min_seconds,
+                settings.fin_marine_poll_max_seconds,
+                marine_fingerprint,
+            ),
+        },
+        settings.poll_client_window_seconds,
+    )
+
+
+poll_scheduler = create_scheduler()
@@ -0,0 +1,448 @@
+"""Transform stage: upstream records to TransformedAircraft
+
+Chunks of raw records can be transformed in a process pool, workers return compact
+tuples (TrackRow) that are cheap to pickle instead of dicts or pydantic models.
+"""
+
+import logging
+import math
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import mgrs  # type: ignore
+from pydantic import ValidationError
+
+from app.clustering import MAX_PRECISION
+from app.config import settings
+from app.enrichment import aircraft_metadata, vessel_metadata
+from app.schemas.schema import TrackPoint, TransformedAircraft
+from app.schemas.schema_marine_traffic import ShipFeature
+
+logger = logging.getLogger(__name__)
+
+mgrs_converter = mgrs.MGRS()
+
+MGRS_DIGITS = re.compile(r"(\d{1,2}[A-Z]{3})(\d*)")
+
+SHIP_TYPES = {
+    30: "fishing",
+    31: "towing",
+    32: "towing",
+    33: "dredging",
+    34: "diving",
+    35: "military",
+    36: "sailing",
+    37: "pleasure craft",
+    50: "pilot vessel",
+    51: "search and rescue",
+    52: "tug",
+    53: "port tender",
+    55: "law enforcement",
+    58: "medical transport",
+}
+SHIP_TYPE_RANGES = (
+    (20, 29, "wing in ground"),
+    (40, 49, "high speed craft"),
+    (60, 69, "passenger"),
+    (70, 79, "cargo"),
+    (80, 89, "tanker"),
+)
+
+# (label, metadata field) pairs appended to the details
+AIRCRAFT_DETAILS = (
+    ("Type", "typecode"),
+    ("Model", "model"),
+    ("Registration", "registration"),
+    ("Operator", "operator"),
+)
+VESSEL_DETAILS = (
+    ("Name", "name"),
+    ("Type", "shipType"),
+    ("Callsign", "callSign"),
+    ("Destination", "destination"),
+)
+
+KNOTS_TO_MS = 0.514444
+
+# Altitude (m), velocity (m/s) and track (degrees) of a track when known
+Motion = Tuple[Optional[float], Optional[float], Optional[float]]
+NO_MOTION: Motion = (None, None, None)
+
+DEFAULT_PRECISION = 1  # 10 km
+# Snapshots keep 1 m positions, coarser views are derived by truncating the MGRS digits
+SNAPSHOT_PRECISION = MAX_PRECISION
+
+
+def to_mgrs_typed(latitude: float, longitude: float, precision: int = DEFAULT_PRECISION) -> str:
+    mgrs_string: str = mgrs_converter.toMGRS(latitude, longitude, True, precision)  # pyright: ignore[reportUnknownMemberType]
+    return mgrs_string
+
+
+def convert_timestamp_to_datetime(timestamp: Optional[int]) -> Optional[str]:
+    """Convert UNIX timestamp to formatted datetime string."""
+    if timestamp is None:
+        return None
+    try:
+        dt = datetime.fromtimestamp(timestamp)
+        return dt.strftime("%d.%m.%Y %H:%M:%S")
+    except Exception as e:
+        logger.error(f"Error converting timestamp {timestamp}: {e}")
+        return None
+
+
+def convert_to_mgrs(
+    longitude: Optional[float], latitude: Optional[float], precision: int = DEFAULT_PRECISION
+) -> Optional[str]:
+    if longitude is None or latitude is None:
+        return None
+    try:
+        mgrs_string: str = to_mgrs_typed(latitude, longitude, precision)
+        return mgrs_string.strip().replace(" ", "")
+    except Exception as e:
+        logger.error(f"Error converting coordinates ({latitude}, {longitude}) to MGRS: {e}")
+        return None
+
+
+def mgrs_cell_centre(position: str) -> str:
+    """Position of the centre of the MGRS cell, the reference is its south-west corner"""
+    match = MGRS_DIGITS.fullmatch(position)
+    if match is None:
+        return position
+    square, digits = match.groups()
+    half = len(digits) // 2
+    if half >= MAX_PRECISION:
+        return position
+    # One more digit per axis, halfway across the cell
+    return f"{square}{digits[:half]}5{digits[half:]}5"
+
+
+def mgrs_position_error(position: Optional[str]) -> float:
+    """Meters from the cell centre to its corners, half the diagonal of the MGRS cell"""
+    match = MGRS_DIGITS.fullmatch(position or "")
+    if match is None:
+        return 0.0
+    cell_m = float(10 ** (MAX_PRECISION - len(match.group(2)) // 2))
+    return cell_m * math.sqrt(2) / 2
+
+
+def convert_from_mgrs(position: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Convert MGRS string back to the (latitude, longitude) of the centre of its cell"""
+    if not position:
+        return None
+    try:
+        latlon: Tuple[float, float] = mgrs_converter.toLatLon(mgrs_cell_centre(position))  # pyright: ignore[reportUnknownMemberType]
+        return latlon
+    except Exception as e:
+        logger.error(f"Error converting MGRS position {position}: {e}")
+        return None
+
+
+def classify_altitude(altitude: Optional[float]) -> Optional[str]:
+    if altitude is None:
+        return None
+    if altitude < 300:
+        return "surface"
+    elif altitude < 3000:
+        return "low"
+    else:
+        return "high"
+
+
+def classify_speed(velocity: Optional[float]) -> Optional[str]:
+    if velocity is None:
+        return None
+    if velocity < 140:
+        return "slow"
+    elif velocity < 280:
+        return "fast"
+    else:
+        return "supersonic"
+
+
+def more_details(aircraft: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not aircraft:
+        return None
+
+    callsign = aircraft.get("callsign")
+    origin_country = aircraft.get("origin_country")
+
+    if not isinstance(callsign, str) or not isinstance(origin_country, str):
+        return None
+
+    details = f"This aircraft[{callsign}] from [{origin_country}] and it is civilian aircraft."
+    return join_details(details, aircraft_metadata(aircraft.get("icao24")), AIRCRAFT_DETAILS)
+
+
+def join_details(
+    details: str, metadata: Optional[Dict[str, str]], labels: Tuple[Tuple[str, str], ...]
+) -> str:
+    if not metadata:
+        return details
+    parts = [f"{label}: {metadata[name]}" for label, name in labels if metadata.get(name)]
+    return " | ".join([details, *parts])
+
+
+def ship_type_name(ship_type: int) -> Optional[str]:
+    """AIS ship type code to a category name"""
+    if ship_type in SHIP_TYPES:
+        return SHIP_TYPES[ship_type]
+    for first, last, name in SHIP_TYPE_RANGES:
+        if first <= ship_type <= last:
+            return name
+    return None
+
+
+def ship_details(feature: ShipFeature) -> str:
+    details = f"MMSI: {feature.mmsi} | Status: {feature.properties.navStat}"
+
+    metadata = vessel_metadata(feature.mmsi)
+    if metadata and metadata.get("shipType", "").isdigit():
+        metadata["shipType"] = ship_type_name(int(metadata["shipType"])) or ""
+    return join_details(details, metadata, VESSEL_DETAILS)
+
+
+def transform_aircraft(
+    aircraft: Dict[str, Any], precision: int = DEFAULT_PRECISION
+) -> TransformedAircraft:
+    true_track_raw = aircraft.get("true_track")
+    try:
+        true_track = int(true_track_raw) if true_track_raw is not None else 0
+    except (ValueError, TypeError):
+        true_track = 0
+
+    transformed: TransformedAircraft = {
+        "id": 0,
+        "aircraftId": aircraft.get("callsign"),
+        "position": convert_to_mgrs(aircraft.get("longitude"), aircraft.get("latitude"), precision),
+        "altitude": classify_altitude(aircraft.get("baro_altitude")),
+        "speed": classify_speed(aircraft.get("velocity")),
+        "direction": true_track,
+        "details": more_details(aircraft),
+        "isExited": bool(aircraft.get("isExited")),
+        "type": "openSky",
+    }
+    return transformed
+
+
+def filter_on_ground(aircraft: Dict[str, Any]) -> bool:
+    # Only aircraft not on ground
+    return not bool(aircraft.get("on_ground"))
+
+
+def transform_practice(aircraft_pc: Dict[str, Any]) -> TransformedAircraft:
+    return {
+        "id": aircraft_pc.get("id", 0),
+        "aircraftId": aircraft_pc.get("aircraftId") or aircraft_pc.get("callsign"),
+        "position": aircraft_pc.get("position"),
+        "altitude": aircraft_pc.get("altitude"),
+        "speed": aircraft_pc.get("speed") or aircraft_pc.get("velocity"),
+        "direction": aircraft_pc.get("direction") or 0,
+        "details": aircraft_pc.get("details"),
+        "isExited": bool(aircraft_pc.get("isExited")),
+        "type": "practiceTool",
+    }
+
+
+def transform_finTraffic_ship(
+    feature: ShipFeature, precision: int = DEFAULT_PRECISION
+) -> TransformedAircraft:
+    coords = feature.geometry.coordinates
+    props = feature.properties
+
+    return {
+        "id": 0,
+        "aircraftId": str(feature.mmsi),
+        # coordinates[0] is Longitude, coordinates[1] is Latitude
+        "position": convert_to_mgrs(coords[0], coords[1], precision),
+        "altitude": "surface",
+        "speed": classify_speed(props.sog),
+        "direction": int(props.heading),
+        "details": ship_details(feature),
+        "isExited": False,
+        "type": "marineTraffic",
+    }
+
+
+def track_point(
+    index: int,
+    track: TransformedAircraft,
+    track_id: Any,
+    latitude: Optional[float],
+    longitude: Optional[float],
+    motion: Motion = NO_MOTION,
+    position_error: float = 0.0,
+) -> Optional[TrackPoint]:
+    if latitude is None or longitude is None:
+        return None
+    track_type = track.get("type") or ""
+    return TrackPoint(
+        index, f"{track_type}:{track_id}", track_type, latitude, longitude, *motion, position_error
+    )
+
+
+TRACK_FIELDS = (
+    "id",
+    "aircraftId",
+    "position",
+    "altitude",
+    "speed",
+    "direction",
+    "details",
+    "isExited",
+    "type",
+)
+
+# TRACK_FIELDS values followed by track id, latitude, longitude, position error and Motion
+TrackRow = Tuple[Any, ...]
+
+
+def track_row(
+    track: TransformedAircraft,
+    track_id: Any,
+    latitude: Optional[float],
+    longitude: Optional[float],
+    motion: Motion = NO_MOTION,
+    position_error: float = 0.0,
+) -> TrackRow:
+    return (
+        *(track.get(name) for name in TRACK_FIELDS),
+        track_id,
+        latitude,
+        longitude,
+        position_error,
+        *motion,
+    )
+
+
+def number_or_none(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+def transform_practice_rows(practice_data: List[Dict[str, Any]]) -> List[TrackRow]:
+    rows: List[TrackRow] = []
+    for pc in practice_data:
+        practice = transform_practice(pc)
+        # Positions are already MGRS, known only to the precision of the cell
+        position = practice.get("position")
+        latitude, longitude = convert_from_mgrs(position) or (None, None)
+        # Altitude is a class such as "low", not meters, so the altitude band never rules
+        # practice tracks out. Speed is used when it is a number (m/s), not a class.
+        motion = (
+            None,
+            number_or_none(pc.get("speed", pc.get("velocity"))),
+            number_or_none(pc.get("direction")),
+        )
+        rows.append(
+            track_row(
+                practice,
+                practice.get("id") or practice.get("aircraftId"),
+                latitude,
+                longitude,
+                motion,
+                mgrs_position_error(position),
+            )
+        )
+    return rows
+
+
+def transform_opensky_rows(aircraft_data: List[Dict[str, Any]], precision: int) -> List[TrackRow]:
+    return [
+        track_row(
+            transform_aircraft(aircraft, precision),
+            aircraft.get("icao24") or aircraft.get("callsign"),
+            aircraft.get("latitude"),
+            aircraft.get("longitude"),
+            (aircraft.get("baro_altitude"), aircraft.get("velocity"), aircraft.get("true_track")),
+        )
+        for aircraft in aircraft_data
+        if filter_on_ground(aircraft)
+    ]
+
+
+def transform_marine_rows(features: List[Dict[str, Any]], precision: int) -> List[TrackRow]:
+    rows: List[TrackRow] = []
+    for f in features:
+        try:
+            ship = ShipFeature(**f)
+        except (ValidationError, KeyError, TypeError) as e:
+            logger.debug(f"Skipping malformed feature: {e}")
+            continue
+        # coordinates[0] is Longitude, coordinates[1] is Latitude
+        coords = ship.geometry.coordinates
+        motion = (0.0, ship.properties.sog * KNOTS_TO_MS, ship.properties.cog)
+        rows.append(
+            track_row(
+                transform_finTraffic_ship(ship, precision), ship.mmsi, coords[1], coords[0], motion
+            )
+        )
+    return rows
+
+
+def rows_to_tracks(rows: List[TrackRow]) -> Tuple[List[TransformedAircraft], List[TrackPoint]]:
+    tracks: List[TransformedAircraft] = []
+    points: List[TrackPoint] = []
+    field_count = len(TRACK_FIELDS)
+    for index, row in enumerate(rows):
+        track: TransformedAircraft = dict(zip(TRACK_FIELDS, row))  # type: ignore[assignment]
+        track_id, latitude, longitude, position_error, *motion = row[field_count:]
+        point = track_point(
+            index, track, track_id, latitude, longitude, tuple(motion), position_error
+        )
+        if point is not None:
+            points.append(point)
+        tracks.append(track)
+    return tracks, points
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if settings.transform_workers <= 0:
+        return None
+    if _pool is None:
+        # Spawned workers, forking a process that runs server threads is not safe
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.transform_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"Started transform pool with {settings.transform_workers} workers")
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def transform_chunked(
+    func: Callable[[List[Dict[str, Any]], int], List[TrackRow]],
+    records: List[Dict[str, Any]],
+    precision: int,
+) -> List[TrackRow]:
+    """Run a row transform over records, split into chunks over the process pool"""
+    chunk_size = max(settings.transform_chunk_size, 1)
+    pool = get_pool()
+    if pool is None or len(records) <= chunk_size:
+        return func(records, precision)
+
+    chunks = [records[start : start + chunk_size] for start in range(0, len(records), chunk_size)]
+    try:
+        futures = [pool.submit(func, chunk, precision) for chunk in chunks]
+        rows: List[TrackRow] = []
+        for future in futures:
+            rows.extend(future.result())
+        return rows
+    except BrokenProcessPool as e:
+        logger.error(f"Transform pool failed, transforming inline: {e}")
+        shutdown_pool()
+        return func(records, precision)
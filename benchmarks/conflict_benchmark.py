@@ -0,0 +1,49 @@
+"""Conflict detection timing with random tracks over the Finland bounding box
+
+Run with: poetry run python -m benchmarks.conflict_benchmark
+"""
+
+import random
+import time
+from typing import List
+
+from app.config import settings
+from app.conflict import detect_conflicts
+from app.schemas.schema import TrackPoint
+
+TRACK_COUNTS = (1_000, 5_000, 10_000, 50_000)
+
+
+def random_points(count: int, generator: random.Random) -> List[TrackPoint]:
+    return [
+        TrackPoint(
+            n,
+            f"openSky:{n:06x}",
+            "openSky",
+            generator.uniform(settings.lat_min, settings.lat_max),
+            generator.uniform(settings.lon_min, settings.lon_max),
+            generator.uniform(0, 12000),
+            generator.uniform(50, 250),
+            generator.uniform(0, 360),
+        )
+        for n in range(count)
+    ]
+
+
+def main() -> None:
+    generator = random.Random(0)
+    for count in TRACK_COUNTS:
+        points = random_points(count, generator)
+        start = time.perf_counter()
+        conflicts = detect_conflicts(
+            points,
+            settings.conflict_distance_km,
+            settings.conflict_altitude_band_m,
+            settings.conflict_horizon_seconds,
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{count:>6} tracks: {elapsed * 1000:8.1f} ms, {len(conflicts)} conflicts")
+
+
+if __name__ == "__main__":
+    main()
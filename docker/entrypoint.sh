@@ -3,9 +3,18 @@
 . /container-init.sh
 
 set -e
+# Geofence membership and events are kept in process memory, so with zones configured the
+# API must run as a single worker unless API_WORKERS is set explicitly
+if [ -n "${GEOFENCE_ZONES_FILE:-}" ]; then
+  WORKERS="${API_WORKERS:-1}"
+else
+  WORKERS="${API_WORKERS:-4}"
+fi
+# Every worker polls OpenSky on its own and takes its share of the daily credits
+export API_WORKERS="${WORKERS}"
 if [ "$#" -eq 0 ]; then
   # FIXME: can we know the traefik/nginx internal docker ip easily ?
-  exec gunicorn "app.main.app" --bind 0.0.0.0:8010 --forwarded-allow-ips='*' -w 4 -k uvicorn.workers.UvicornWorker
+  exec gunicorn "app.main.app" --bind 0.0.0.0:8010 --forwarded-allow-ips='*' -w "${WORKERS}" -k uvicorn.workers.UvicornWorker
 else
   exec "$@"
 fi
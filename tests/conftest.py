@@ -0,0 +1,11 @@
+import pytest
+
+from app.api import radar_api
+from app.tasks.scheduler import poll_scheduler
+
+
+@pytest.fixture(autouse=True)
+def fresh_sources(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Every test polls its own mocked sources instead of results cached by earlier tests"""
+    poll_scheduler.reset()
+    monkeypatch.setattr(radar_api, "_published", None)
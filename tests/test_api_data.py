@@ -69,7 +69,7 @@ def test_get_aircraft_data_combined(
 ) -> None:
     mock_fetch_practice.return_value = dummy_practice_data
     mock_fetch_opensky.return_value = dummy_opensky_data
-    mock_fetch_fin_marine.return_value = [create_dummy_ship_feature()]
+    mock_fetch_fin_marine.return_value = [create_dummy_ship_feature().model_dump()]
 
     response = client.get("/radar/aircraft")
 
@@ -0,0 +1,105 @@
+from typing import Any, Dict, List
+from unittest.mock import patch, MagicMock
+
+from fastapi.testclient import TestClient
+
+from app.clustering import cluster_tracks, truncate_mgrs
+from app.main import app
+from app.schemas.schema import TransformedAircraft
+
+client = TestClient(app)
+
+
+def test_truncate_mgrs() -> None:
+    assert truncate_mgrs("35VLG8637612345", 5) == "35VLG8637612345"
+    assert truncate_mgrs("35VLG8637612345", 2) == "35VLG8612"
+    assert truncate_mgrs("35VLG8637612345", 0) == "35VLG"
+    # Never invents precision that the position does not have
+    assert truncate_mgrs("35VMS12", 3) == "35VMS12"
+    assert truncate_mgrs(None, 1) is None
+
+
+def test_cluster_tracks() -> None:
+    tracks: List[TransformedAircraft] = [
+        {
+            "position": "35VLG8637612345",
+            "type": "marineTraffic",
+            "altitude": "surface",
+            "speed": "slow",
+        },
+        {
+            "position": "35VLG8699912999",
+            "type": "marineTraffic",
+            "altitude": "surface",
+            "speed": "slow",
+        },
+        {"position": "35VLG1111111111", "type": "openSky", "altitude": "high", "speed": "fast"},
+        {"position": None, "type": "openSky", "altitude": "high", "speed": "fast"},
+    ]
+
+    clusters = cluster_tracks(tracks, 1)
+    assert [(c["cell"], c["count"]) for c in clusters] == [("35VLG11", 1), ("35VLG81", 2)]
+    assert clusters[1]["sources"] == {"marineTraffic": 2}
+    assert clusters[1]["speed"] == {"slow": 2}
+
+    clusters = cluster_tracks(tracks, 0)
+    assert len(clusters) == 1
+    assert clusters[0]["altitude"] == {"surface": 2, "high": 1}
+
+
+dummy_opensky_data: List[Dict[str, Any]] = [
+    {
+        "icao24": "461f2b",
+        "callsign": "FIN123",
+        "longitude": 24.9,
+        "latitude": 60.1,
+        "baro_altitude": 5000,
+        "velocity": 200,
+        "true_track": 180,
+        "on_ground": False,
+        "origin_country": "Finland",
+    },
+    {
+        "icao24": "461f2c",
+        "callsign": "FIN124",
+        "longitude": 24.91,
+        "latitude": 60.11,
+        "baro_altitude": 1000,
+        "velocity": 100,
+        "true_track": 90,
+        "on_ground": False,
+        "origin_country": "Finland",
+    },
+]
+
+
+@patch("app.api.radar_api.fetch_fin_marine_traffic_data")
+@patch("app.api.radar_api.fetch_practice_data")
+@patch("app.api.radar_api.fetch_aircraft_data")
+def test_precision_and_clusters_endpoints(
+    mock_fetch_opensky: MagicMock,
+    mock_fetch_practice: MagicMock,
+    mock_fetch_fin_marine: MagicMock,
+) -> None:
+    mock_fetch_opensky.return_value = dummy_opensky_data
+    mock_fetch_practice.return_value = []
+    mock_fetch_fin_marine.return_value = []
+
+    default = client.get("/radar/aircraft").json()
+    assert default[0]["position"] == "35VLG86"
+
+    precise = client.get("/radar/aircraft", params={"precision": 5}).json()
+    assert len(precise[0]["position"]) == len("35VLG") + 10
+
+    assert client.get("/radar/aircraft", params={"precision": 6}).status_code == 422
+
+    clusters = client.get("/radar/aircraft/clusters", params={"precision": 0}).json()
+    assert clusters == [
+        {
+            "cell": "35VLG",
+            "count": 2,
+            "sources": {"openSky": 2},
+            "altitude": {"high": 1, "low": 1},
+            "speed": {"fast": 1, "slow": 1},
+        }
+    ]
@@ -0,0 +1,215 @@
+import math
+import random
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch, MagicMock
+
+from fastapi.testclient import TestClient
+
+from app.conflict import KM_PER_DEGREE, closest_approach, detect_conflicts, relative_position
+from app.main import app
+from app.schemas.schema import TrackPoint
+
+client = TestClient(app)
+
+
+def point(
+    key: str,
+    latitude: float,
+    longitude: float,
+    altitude: Optional[float] = 1000.0,
+    velocity: Optional[float] = None,
+    heading: Optional[float] = None,
+    track_type: str = "openSky",
+) -> TrackPoint:
+    return TrackPoint(0, key, track_type, latitude, longitude, altitude, velocity, heading)
+
+
+def test_distance_and_altitude_band() -> None:
+    points = [
+        point("a", 60.0, 25.0),
+        point("b", 60.02, 25.0),  # 2.2 km north of a
+        point("c", 60.0, 25.0, altitude=5000),  # Same position, far above
+        point("d", 61.0, 25.0),
+        point("e", 60.0, 25.01, altitude=None, track_type="marineTraffic"),
+    ]
+    conflicts = detect_conflicts(points, 5.0, 300, 300, types=["openSky"])
+    assert [(c["trackA"], c["trackB"]) for c in conflicts] == [("a", "b")]
+    assert conflicts[0]["distanceKm"] == round(0.02 * KM_PER_DEGREE, 3)
+    assert conflicts[0]["altitudeDifference"] == 0
+
+    # Unknown altitude is never ruled out by the band
+    conflicts = detect_conflicts(points, 5.0, 300, 300)
+    assert ("a", "e") in [(c["trackA"], c["trackB"]) for c in conflicts]
+
+
+def test_closest_approach() -> None:
+    # Head on 4 km apart at 100 m/s each, meet after 20 s
+    head_on = [
+        point("west", 60.0, 25.0, velocity=100, heading=90),
+        point(
+            "east",
+            60.0,
+            25.0 + 4 / (KM_PER_DEGREE * math.cos(math.radians(60))),
+            velocity=100,
+            heading=270,
+        ),
+    ]
+    [conflict] = detect_conflicts(head_on, 5.0, 300, 300)
+    assert conflict["distanceKm"] == 4.0
+    assert conflict["cpaDistanceKm"] == 0.0
+    assert conflict["cpaSeconds"] == 20.0
+
+    # Diverging tracks are closest now
+    diverging = [head_on[0]._replace(heading=270), head_on[1]._replace(heading=90)]
+    [conflict] = detect_conflicts(diverging, 5.0, 300, 300)
+    assert conflict["cpaSeconds"] == 0.0
+    assert conflict["cpaDistanceKm"] == conflict["distanceKm"]
+
+    # Projection stops at the horizon
+    [conflict] = detect_conflicts(head_on, 5.0, 300, 10)
+    assert conflict["cpaSeconds"] == 10.0
+    assert conflict["cpaDistanceKm"] == 2.0
+
+
+def test_spatial_hash_matches_all_pairs() -> None:
+    generator = random.Random(7)
+    points = [
+        point(str(n), generator.uniform(64.0, 64.5), generator.uniform(25.0, 26.0))
+        for n in range(400)
+    ]
+    expected = set()
+    for i, a in enumerate(points):
+        for b in points[i + 1 :]:
+            dx = (
+                (b.longitude - a.longitude)
+                * KM_PER_DEGREE
+                * math.cos(math.radians((a.latitude + b.latitude) / 2))
+            )
+            dy = (b.latitude - a.latitude) * KM_PER_DEGREE
+            if math.hypot(dx, dy) <= 3.0:
+                expected.add((a.key, b.key))
+
+    conflicts = detect_conflicts(points, 3.0, 300, 300)
+    assert expected
+    assert {(c["trackA"], c["trackB"]) for c in conflicts} == expected
+
+
+def test_converging_from_outside_alert_distance() -> None:
+    # Head on 20 km apart at 250 m/s each, meet after 40 s
+    head_on = [
+        point("west", 60.0, 25.0, velocity=250, heading=90),
+        point(
+            "east",
+            60.0,
+            25.0 + 20 / (KM_PER_DEGREE * math.cos(math.radians(60))),
+            velocity=250,
+            heading=270,
+        ),
+    ]
+    [conflict] = detect_conflicts(head_on, 5.0, 300, 300)
+    assert conflict["distanceKm"] == 20.0
+    assert conflict["cpaDistanceKm"] == 0.0
+    assert conflict["cpaSeconds"] == 40.0
+
+    # Too far to meet within the horizon
+    assert detect_conflicts(head_on, 5.0, 300, 20) == []
+    # Same speed and track, never closer
+    parallel = [head_on[0], head_on[1]._replace(heading=90)]
+    assert detect_conflicts(parallel, 5.0, 300, 300) == []
+
+
+def test_moving_tracks_match_all_pairs() -> None:
+    generator = random.Random(11)
+    points = [
+        point(
+            str(n),
+            generator.uniform(64.0, 65.0),
+            generator.uniform(24.0, 27.0),
+            velocity=generator.uniform(0, 250),
+            heading=generator.uniform(0, 360),
+        )
+        for n in range(300)
+    ]
+    expected = set()
+    for i, a in enumerate(points):
+        for b in points[i + 1 :]:
+            rx, ry = relative_position(a, b)
+            if closest_approach(a, b, rx, ry, 120)[0] <= 3000:
+                expected.add((a.key, b.key))
+
+    conflicts = detect_conflicts(points, 3.0, 300, 120)
+    assert expected
+    assert {(c["trackA"], c["trackB"]) for c in conflicts} == expected
+
+
+dummy_opensky_data: List[Dict[str, Any]] = [
+    {
+        "icao24": "461f2b",
+        "callsign": "FIN123",
+        "longitude": 24.9,
+        "latitude": 60.1,
+        "baro_altitude": 5000,
+        "velocity": 200,
+        "true_track": 90,
+        "on_ground": False,
+        "origin_country": "Finland",
+    },
+    {
+        "icao24": "461f2c",
+        "callsign": "FIN124",
+        "longitude": 24.95,
+        "latitude": 60.1,
+        "baro_altitude": 5100,
+        "velocity": 200,
+        "true_track": 270,
+        "on_ground": False,
+        "origin_country": "Finland",
+    },
+]
+
+
+@patch("app.api.radar_api.fetch_fin_marine_traffic_data")
+@patch("app.api.radar_api.fetch_practice_data")
+@patch("app.api.radar_api.fetch_aircraft_data")
+def test_conflicts_endpoint(
+    mock_fetch_opensky: MagicMock,
+    mock_fetch_practice: MagicMock,
+    mock_fetch_fin_marine: MagicMock,
+) -> None:
+    mock_fetch_opensky.return_value = dummy_opensky_data
+    mock_fetch_practice.return_value = []
+    mock_fetch_fin_marine.return_value = []
+
+    response = client.get("/radar/conflicts")
+    assert response.status_code == 200
+    [conflict] = response.json()
+    assert (conflict["trackA"], conflict["trackB"]) == ("openSky:461f2b", "openSky:461f2c")
+    assert conflict["altitudeDifference"] == 100
+    assert conflict["cpaDistanceKm"] == 0.0
+
+
+@patch("app.api.radar_api.fetch_fin_marine_traffic_data")
+@patch("app.api.radar_api.fetch_practice_data")
+@patch("app.api.radar_api.fetch_aircraft_data")
+def test_practice_track_conflicts_with_aircraft(
+    mock_fetch_opensky: MagicMock,
+    mock_fetch_practice: MagicMock,
+    mock_fetch_fin_marine: MagicMock,
+) -> None:
+    mock_fetch_opensky.return_value = [
+        {**dummy_opensky_data[0], "latitude": 60.17, "longitude": 24.94}
+    ]
+    # Same spot to the nearest 10 km, the altitude class does not rule it out
+    mock_fetch_practice.return_value = [
+        {"id": 7, "position": "35VLG87", "altitude": "high", "speed": "fast", "direction": 0}
+    ]
+    mock_fetch_fin_marine.return_value = []
+
+    # The cell centre is 3 km away, within the alert distance once the cell size is counted
+    with patch("app.api.radar_api.settings.conflict_distance_km", 2.0):
+        response = client.get("/radar/conflicts")
+    assert response.status_code == 200
+    [conflict] = response.json()
+    assert {conflict["trackA"], conflict["trackB"]} == {"openSky:461f2b", "practiceTool:7"}
+    assert conflict["altitudeDifference"] is None
+    assert conflict["distanceKm"] > 2.0
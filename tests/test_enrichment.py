@@ -0,0 +1,96 @@
+import os
+from pathlib import Path
+from typing import Dict
+from unittest.mock import patch
+
+from app.enrichment import (
+    MetadataTable,
+    Record,
+    refresh_aircraft,
+    write_table,
+)
+from app.transform import more_details, transform_marine_rows
+from tests.test_transform import make_ship
+
+
+def test_table_roundtrip(tmp_path: Path) -> None:
+    records: Dict[int, Record] = {
+        mmsi: (f"VESSEL {mmsi}", "70", "", "") for mmsi in range(230000000, 230005000, 7)
+    }
+    filepth = tmp_path / "vessels.table"
+    write_table(filepth, records, updated_ms=1760860800000)
+
+    table = MetadataTable(filepth)
+    assert table.updated_ms == 1760860800000
+    assert table.get(230000007) == ("VESSEL 230000007", "70", "", "")
+    assert table.get(230000008) is None
+    assert dict(table.items()) == records
+
+
+def test_enriched_details(tmp_path: Path) -> None:
+    write_table(tmp_path / "vessels.table", {219598000: ("AURORA", "60", "OJOY", "VAASA")})
+    database = tmp_path / "aircraft.csv"
+    database.write_text(
+        "icao24,registration,manufacturername,model,typecode,operator\n"
+        "461f2b,OH-LXA,Airbus,A320 214,A320,Finnair\n",
+        encoding="utf-8",
+    )
+
+    with (
+        patch("app.enrichment.settings.enrichment_dir", str(tmp_path)),
+        patch("app.enrichment.settings.aircraft_database_file", str(database)),
+        patch("app.enrichment.RELOAD_CHECK_SECONDS", 0.0),
+    ):
+        refresh_aircraft(tmp_path / "aircraft.table")
+        details = more_details(
+            {"icao24": "461f2b", "callsign": "FIN123", "origin_country": "Finland"}
+        )
+        rows = transform_marine_rows([make_ship(219598000)], 1)
+
+    assert details == (
+        "This aircraft[FIN123] from [Finland] and it is civilian aircraft."
+        " | Type: A320 | Model: A320 214 | Registration: OH-LXA | Operator: Finnair"
+    )
+    assert rows[0][6] == (
+        "MMSI: 219598000 | Status: 1 | Name: AURORA | Type: passenger"
+        " | Callsign: OJOY | Destination: VAASA"
+    )
+
+
+def test_damaged_table_falls_back(tmp_path: Path) -> None:
+    database = tmp_path / "aircraft.csv"
+    database.write_text(
+        "icao24,registration,model,typecode,operator\n"
+        + "".join(f"{n:06x},OH-{n},A320 214,A320,Finnair\n" for n in range(5000)),
+        encoding="utf-8",
+    )
+    filepth = tmp_path / "aircraft.table"
+    # The last record written, its value is at the very end of the file
+    aircraft = {"icao24": f"{4999:06x}", "callsign": "FIN7", "origin_country": "Finland"}
+    plain = "This aircraft[FIN7] from [Finland] and it is civilian aircraft."
+
+    with (
+        patch("app.enrichment.settings.enrichment_dir", str(tmp_path)),
+        patch("app.enrichment.settings.aircraft_database_file", str(database)),
+        patch("app.enrichment.RELOAD_CHECK_SECONDS", 0.0),
+        patch.dict("app.enrichment._tables", clear=True),
+    ):
+        refresh_aircraft(filepth)
+        details = more_details(aircraft)
+        assert details is not None and "Registration: OH-4999" in details
+
+        # Slots cut short, and slots intact but values cut short
+        for size in (filepth.stat().st_size // 3, filepth.stat().st_size - 10):
+            refresh_aircraft(filepth)
+            # Replaced like a refresh does, truncating a mapped file in place would SIGBUS
+            damaged = tmp_path / "damaged"
+            damaged.write_bytes(filepth.read_bytes()[:size])
+            os.replace(damaged, filepth)
+            with patch.dict("app.enrichment._tables", clear=True):
+                assert more_details(aircraft) == plain
+
+        # The next refresh replaces the damaged table although it is newer than the source
+        refresh_aircraft(filepth)
+        details = more_details(aircraft)
+        assert details is not None and "Registration: OH-4999" in details
+    assert not list(tmp_path.glob(".aircraft.table.*"))
@@ -0,0 +1,119 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+from unittest.mock import patch, MagicMock
+
+from fastapi.testclient import TestClient
+
+from app.geofence import GeofenceMonitor, load_zones, point_in_polygon
+from app.main import app
+from app.schemas.schema import TrackPoint
+from app.schemas.schema_geofence import GeofenceZone
+
+client = TestClient(app)
+
+# Roughly the sea area south of Helsinki
+helsinki_zone = GeofenceZone(
+    id="hki",
+    name="Helsinki approach",
+    polygon=[[24.5, 59.9], [25.5, 59.9], [25.5, 60.3], [24.5, 60.3], [24.5, 59.9]],
+)
+
+
+def make_point(
+    key: str, latitude: float, longitude: float, track_type: str = "openSky"
+) -> TrackPoint:
+    return TrackPoint(0, f"{track_type}:{key}", track_type, latitude, longitude)
+
+
+def test_point_in_polygon() -> None:
+    assert point_in_polygon(25.0, 60.1, helsinki_zone.polygon)
+    assert not point_in_polygon(26.0, 60.1, helsinki_zone.polygon)
+    assert not point_in_polygon(25.0, 61.0, helsinki_zone.polygon)
+
+
+def test_enter_and_exit_events() -> None:
+    monitor = GeofenceMonitor([helsinki_zone], grid_size=0.1, event_limit=100)
+
+    events = monitor.evaluate([make_point("a", 60.1, 25.0), make_point("b", 62.0, 25.0)], 100)
+    assert [(e["trackId"], e["event"]) for e in events] == [("openSky:a", "enter")]
+
+    # Still inside, no new events
+    assert monitor.evaluate([make_point("a", 60.2, 25.1), make_point("b", 62.0, 25.0)], 110) == []
+
+    events = monitor.evaluate([make_point("a", 61.0, 25.1), make_point("b", 60.0, 25.0)], 120)
+    assert sorted((e["trackId"], e["event"]) for e in events) == [
+        ("openSky:a", "exit"),
+        ("openSky:b", "enter"),
+    ]
+    ids = [e["id"] for e in monitor.events()]
+    assert ids == sorted(ids) and len(set(ids)) == 3
+    assert [e["id"] for e in monitor.events(since=ids[0])] == ids[1:]
+
+
+def test_missing_source_does_not_exit() -> None:
+    monitor = GeofenceMonitor([helsinki_zone], grid_size=0.1, event_limit=100)
+    monitor.evaluate([make_point("219598000", 60.1, 25.0, "marineTraffic")], 100)
+
+    # Marine source returned nothing, the vessel must not be reported as exited
+    assert monitor.evaluate([make_point("a", 65.0, 25.0)], 110) == []
+
+
+def test_load_zones(tmp_path: Path) -> None:
+    filepth = tmp_path / "zones.json"
+    filepth.write_text(
+        json.dumps(
+            {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "properties": {"id": "hki", "name": "Helsinki approach"},
+                        "geometry": {"type": "Polygon", "coordinates": [helsinki_zone.polygon]},
+                    },
+                    {"type": "Feature", "geometry": {"type": "Point", "coordinates": [25, 60]}},
+                ],
+            }
+        ),
+        encoding="utf-8",
+    )
+    assert load_zones(filepth) == [helsinki_zone]
+
+
+dummy_opensky_data: List[Dict[str, Any]] = [
+    {
+        "icao24": "461f2b",
+        "callsign": "FIN123",
+        "longitude": 25.0,
+        "latitude": 60.1,
+        "baro_altitude": 5000,
+        "velocity": 200,
+        "true_track": 180,
+        "on_ground": False,
+        "origin_country": "Finland",
+    }
+]
+
+
+@patch("app.api.radar_api.fetch_fin_marine_traffic_data")
+@patch("app.api.radar_api.fetch_practice_data")
+@patch("app.api.radar_api.fetch_aircraft_data")
+def test_geofence_events_endpoint(
+    mock_fetch_opensky: MagicMock,
+    mock_fetch_practice: MagicMock,
+    mock_fetch_fin_marine: MagicMock,
+) -> None:
+    mock_fetch_opensky.return_value = dummy_opensky_data
+    mock_fetch_practice.return_value = []
+    mock_fetch_fin_marine.return_value = []
+
+    monitor = GeofenceMonitor([helsinki_zone], grid_size=0.1, event_limit=100)
+    with patch("app.api.radar_api.geofence_monitor", monitor):
+        zones = client.get("/radar/geofence/zones").json()
+        # Polling the events alone keeps the zones evaluated
+        events = client.get("/radar/geofence/events").json()
+
+    assert zones[0]["id"] == "hki"
+    assert len(events) == 1
+    assert events[0]["trackId"] == "openSky:461f2b"
+    assert events[0]["event"] == "enter"
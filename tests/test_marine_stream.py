@@ -0,0 +1,178 @@
+import json
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+from unittest.mock import MagicMock, patch
+
+from websockets.sync.server import ServerConnection, serve
+from websockets.typing import Subprotocol
+
+from app.tasks.marine_stream_task import (
+    MarineStream,
+    VesselTable,
+    get_marine_stream,
+    location_to_feature,
+)
+from app.tasks.marine_traffic_task import fetch_fin_marine_traffic_data
+
+FINLAND = (59.5, 70.0, 19.5, 31.5)
+
+location: Dict[str, Any] = {
+    "time": 1760860800,
+    "sog": 10.7,
+    "cog": 326.6,
+    "navStat": 0,
+    "rot": 0,
+    "posAcc": True,
+    "raim": False,
+    "heading": 325,
+    "lon": 24.9667,
+    "lat": 60.1666,
+}
+
+
+def test_table_bbox_and_ttl() -> None:
+    table = VesselTable(ttl_seconds=60, bbox=FINLAND)
+    table.update(location_to_feature(230000001, location), now=0)
+    table.update(location_to_feature(230000002, {**location, "lat": 55.0}), now=0)
+    table.update(location_to_feature(230000003, location), now=30)
+    assert [f["mmsi"] for f in table.features(now=50)] == [230000001, 230000003]
+
+    # Vessel 1 reports again and vessel 3 sails out of the area
+    table.update(location_to_feature(230000001, location), now=70)
+    table.update(location_to_feature(230000003, {**location, "lon": 15.0}), now=75)
+    assert [f["mmsi"] for f in table.features(now=100)] == [230000001]
+    assert table.features(now=200) == []
+
+
+CONNECT, SUBSCRIBE, DISCONNECT = 1, 8, 14
+
+
+def packet(first_byte: int, body: bytes) -> bytes:
+    length = bytearray()
+    remaining = len(body)
+    while True:
+        remaining, digit = divmod(remaining, 128)
+        length.append(digit | (0x80 if remaining else 0))
+        if not remaining:
+            return bytes([first_byte]) + bytes(length) + body
+
+
+def publish_packet(topic: str, payload: Dict[str, Any]) -> bytes:
+    name = topic.encode("utf-8")
+    return packet(0x30, len(name).to_bytes(2, "big") + name + json.dumps(payload).encode("utf-8"))
+
+
+def read_packets(websocket: ServerConnection) -> Iterator[Tuple[int, bytes]]:
+    """Packet type and body of each client packet, whatever the WebSocket framing"""
+    buffer = b""
+    while True:
+        message = websocket.recv()
+        assert isinstance(message, bytes)
+        buffer += message
+        while len(buffer) >= 2:
+            length, multiplier, offset = 0, 1, 1
+            while buffer[offset] & 0x80:
+                length += (buffer[offset] & 0x7F) * multiplier
+                multiplier *= 128
+                offset += 1
+            length += buffer[offset] * multiplier
+            end = offset + 1 + length
+            if len(buffer) < end:
+                break
+            yield buffer[0] >> 4, buffer[offset + 1 : end]
+            buffer = buffer[end:]
+
+
+def run_broker(
+    suback_code: int, after_subscribe: Callable[[ServerConnection], None], received: List[int]
+) -> Callable[[ServerConnection], None]:
+    """Stand-in broker: accept CONNECT, answer SUBSCRIBE with the given code"""
+
+    def broker(websocket: ServerConnection) -> None:
+        for packet_type, body in read_packets(websocket):
+            received.append(packet_type)
+            if packet_type == CONNECT:
+                websocket.send(b"\x20\x02\x00\x00")  # CONNACK
+            elif packet_type == SUBSCRIBE:
+                # SUBACK echoes the packet identifier of the SUBSCRIBE
+                websocket.send(packet(0x90, body[:2] + bytes([suback_code])))
+                after_subscribe(websocket)
+            elif packet_type == DISCONNECT:
+                return
+
+    return broker
+
+
+def start_stream(port: int, table: VesselTable) -> MarineStream:
+    stream = MarineStream(table, f"ws://127.0.0.1:{port}/mqtt", "vessels-v2/+/location")
+    seed = [location_to_feature(230000009, location)]
+    stream.start(seed=lambda: seed)
+    return stream
+
+
+def test_stream_against_local_broker() -> None:
+    received: List[int] = []
+
+    def publish(websocket: ServerConnection) -> None:
+        inside = publish_packet("vessels-v2/230000001/location", location)
+        # Packets do not have to align with WebSocket frames
+        websocket.send(inside[:10])
+        websocket.send(
+            inside[10:] + publish_packet("vessels-v2/230000002/location", {**location, "lat": 55.0})
+        )
+        websocket.send(publish_packet("vessels-v2/230000003/metadata", {"name": "IGNORED"}))
+
+    broker = run_broker(0, publish, received)
+    with serve(broker, "127.0.0.1", 0, subprotocols=[Subprotocol("mqtt")]) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        table = VesselTable(ttl_seconds=60, bbox=FINLAND)
+        stream = start_stream(server.socket.getsockname()[1], table)
+        try:
+            assert stream.subscribed.wait(5)
+            for _ in range(50):
+                if len(table) == 2:
+                    break
+                threading.Event().wait(0.1)
+        finally:
+            stream.stop()
+            server.shutdown()
+
+    assert received[:2] == [CONNECT, SUBSCRIBE]
+    assert sorted(f["mmsi"] for f in table.features()) == [230000001, 230000009]
+
+
+def test_rejected_subscription() -> None:
+    received: List[int] = []
+    broker = run_broker(0x80, lambda websocket: None, received)
+    with serve(broker, "127.0.0.1", 0, subprotocols=[Subprotocol("mqtt")]) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stream = start_stream(server.socket.getsockname()[1], VesselTable(60, FINLAND))
+        try:
+            for _ in range(50):
+                if SUBSCRIBE in received:
+                    break
+                threading.Event().wait(0.1)
+            threading.Event().wait(0.2)
+            assert not stream.subscribed.is_set()
+        finally:
+            stream.stop()
+            server.shutdown()
+
+    assert SUBSCRIBE in received
+
+
+@patch("app.tasks.marine_traffic_task.fetch_fin_marine_locations")
+def test_stream_created_only_in_stream_mode(mock_locations: MagicMock) -> None:
+    mock_locations.return_value = [location_to_feature(230000001, location)]
+    get_marine_stream.cache_clear()
+    with patch("app.tasks.marine_traffic_task.settings.fin_marine_ingestion", "poll"):
+        assert fetch_fin_marine_traffic_data() == mock_locations.return_value
+    assert get_marine_stream.cache_info().currsize == 0
+
+    stream = MagicMock()
+    with (
+        patch("app.tasks.marine_traffic_task.settings.fin_marine_ingestion", "stream"),
+        patch("app.tasks.marine_traffic_task.get_marine_stream", return_value=stream),
+    ):
+        fetch_fin_marine_traffic_data()
+    stream.start.assert_called_once()
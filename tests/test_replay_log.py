@@ -0,0 +1,157 @@
+import json
+import threading
+import zlib
+from pathlib import Path
+from typing import List
+from unittest.mock import MagicMock, patch
+
+from fastapi.testclient import TestClient
+
+from app.api import radar_api
+from app.main import app
+from app.replay_log import ReplayLog
+from app.schemas.schema import TransformedAircraft
+
+client = TestClient(app)
+
+
+def make_tracks(direction: int) -> List[TransformedAircraft]:
+    return [
+        {
+            "id": 0,
+            "aircraftId": "FIN123",
+            "position": "35VLG75",
+            "altitude": "high",
+            "speed": "fast",
+            "direction": direction,
+            "details": None,
+            "isExited": False,
+            "type": "openSky",
+        }
+    ]
+
+
+def make_log(directory: Path, segment_max_seconds: float = 3600) -> ReplayLog:
+    return ReplayLog(directory, 1024 * 1024, segment_max_seconds, retention_seconds=600)
+
+
+def test_frame_at_and_range(tmp_path: Path) -> None:
+    log = make_log(tmp_path, segment_max_seconds=20)
+    for second in range(0, 100, 10):
+        assert log.append(1000.0 + second, make_tracks(second))
+
+    # Seeking between frames returns the frame that was current at that moment
+    frame = log.frame_at(1055.0)
+    assert frame is not None
+    assert frame[0] == 1050.0
+    assert json.loads(frame[1])[0]["direction"] == 50
+    assert log.frame_at(999.0) is None
+
+    frames = log.frames_between(1015.0, 1060.0, limit=100)
+    assert [timestamp for timestamp, _ in frames] == [1020.0, 1030.0, 1040.0, 1050.0, 1060.0]
+    assert len(log.frames_between(1000.0, 2000.0, limit=3)) == 3
+
+    # Rotated by age, reopening the directory finds every segment
+    assert len(list(tmp_path.glob("*.seg"))) == 5
+    assert make_log(tmp_path).frame_at(2000.0) == log.frame_at(2000.0)
+
+
+def test_duplicate_frames_are_skipped(tmp_path: Path) -> None:
+    log = make_log(tmp_path)
+    assert log.append(1000.0, make_tracks(90))
+    assert not log.append(1010.0, make_tracks(90))
+    assert len(log.frames_between(0.0, 2000.0, limit=100)) == 1
+
+
+def test_retention(tmp_path: Path) -> None:
+    log = make_log(tmp_path, segment_max_seconds=60)
+    for minute in range(30):
+        log.append(1000.0 + minute * 60, make_tracks(minute))
+
+    # Ten minute retention with one minute segments
+    assert len(list(tmp_path.glob("*.seg"))) <= 12
+    assert log.frame_at(1000.0) is None
+    assert log.frame_at(1000.0 + 29 * 60) is not None
+
+
+def test_replay_endpoint(tmp_path: Path) -> None:
+    log = make_log(tmp_path)
+    log.append(1760860800.0, make_tracks(10))
+    log.append(1760860810.0, make_tracks(20))
+
+    with patch("app.api.radar_api.replay_log", log):
+        response = client.get("/radar/replay", params={"at": 1760860805})
+        assert response.status_code == 200
+        assert response.json()["tracks"][0]["direction"] == 10
+
+        response = client.get("/radar/replay", params={"from": 1760860800, "to": 1760860900})
+        assert [frame["timestamp"] for frame in response.json()] == [1760860800.0, 1760860810.0]
+
+        assert client.get("/radar/replay", params={"at": 1700000000}).status_code == 404
+        assert client.get("/radar/replay").status_code == 400
+
+
+def test_workers_share_one_log(tmp_path: Path) -> None:
+    # One instance per worker process over the same directory
+    first = make_log(tmp_path, segment_max_seconds=1)
+    second = make_log(tmp_path, segment_max_seconds=1)
+    assert first.append(1000.0, make_tracks(0))
+    assert second.append(1001.0, make_tracks(1))
+    assert first.append(1002.0, make_tracks(2))
+    # The same picture published by another worker, and a frame older than the log
+    assert not second.append(1002.5, make_tracks(2))
+    assert not second.append(1001.5, make_tracks(3))
+    assert second.append(1003.0, make_tracks(3))
+
+    frames = first.frames_between(0.0, 5000.0, limit=100)
+    assert [timestamp for timestamp, _ in frames] == [1000.0, 1001.0, 1002.0, 1003.0]
+    frame = second.frame_at(1002.7)
+    assert frame is not None and frame[0] == 1002.0
+
+
+def test_replay_endpoint_read_error(tmp_path: Path) -> None:
+    log = make_log(tmp_path)
+    with (
+        patch("app.api.radar_api.replay_log", log),
+        patch.object(log, "frame_at", side_effect=FileNotFoundError("segment removed")),
+    ):
+        assert client.get("/radar/replay", params={"at": 1760860805}).status_code == 503
+
+    # A corrupt frame, and an empty data file that cannot be mapped
+    for error in (
+        zlib.error("invalid stored block lengths"),
+        ValueError("cannot mmap an empty file"),
+    ):
+        with (
+            patch("app.api.radar_api.replay_log", log),
+            patch.object(log, "frames_between", side_effect=error),
+        ):
+            params = {"from": 1760860800, "to": 1760860900}
+            assert client.get("/radar/replay", params=params).status_code == 503
+
+
+@patch("app.api.radar_api.fetch_fin_marine_traffic_data")
+@patch("app.api.radar_api.fetch_practice_data")
+@patch("app.api.radar_api.fetch_aircraft_data")
+def test_recorded_without_clients(
+    mock_fetch_opensky: MagicMock,
+    mock_fetch_practice: MagicMock,
+    mock_fetch_fin_marine: MagicMock,
+    tmp_path: Path,
+) -> None:
+    mock_fetch_opensky.return_value = []
+    mock_fetch_practice.return_value = []
+    mock_fetch_fin_marine.return_value = []
+
+    log = make_log(tmp_path)
+    recorded = threading.Event()
+    with (
+        patch("app.api.radar_api.replay_log", log),
+        patch("app.api.radar_api.settings.snapshot_record_seconds", 0.01),
+        patch.object(log, "append", side_effect=lambda *args: recorded.set()),
+    ):
+        radar_api.start_recorder()
+        try:
+            assert recorded.wait(5)
+        finally:
+            radar_api.stop_recorder()
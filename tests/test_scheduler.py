@@ -0,0 +1,212 @@
+from typing import Any, Dict, List
+from unittest.mock import patch, MagicMock
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.tasks.scheduler import (
+    DAY_SECONDS,
+    ClientTracker,
+    CreditBudget,
+    PollPolicy,
+    Polled,
+    SourcePoller,
+    create_scheduler,
+    opensky_fingerprint,
+)
+
+client = TestClient(app)
+
+MIDNIGHT = 1760832000.0  # 2025-10-19T00:00:00Z
+
+
+def aircraft(count: int, moved: int = 0) -> List[Dict[str, Any]]:
+    return [
+        {"icao24": f"{n:06x}", "latitude": 60.0 + (0.1 if n < moved else 0), "longitude": 25.0}
+        for n in range(count)
+    ]
+
+
+def test_interval_follows_change_rate() -> None:
+    poller = SourcePoller("openSky", PollPolicy(5, 300, opensky_fingerprint))
+    now = MIDNIGHT
+    poller.poll(lambda: aircraft(10), clients=1, now=now)
+    assert poller.interval == 5
+
+    # Nothing changes, the interval doubles on every poll up to the maximum
+    for _ in range(10):
+        now += poller.effective_interval(now, 1)
+        poller.poll(lambda: aircraft(10), clients=1, now=now)
+    assert poller.interval == 300
+
+    # Everything moves, the interval halves
+    now += 300
+    poller.poll(lambda: aircraft(10, moved=10), clients=1, now=now)
+    assert poller.interval == 150
+
+    # Two of ten tracks moved since the last poll, the target share keeps the interval
+    now += 150
+    with patch("app.tasks.scheduler.settings.poll_target_change", 0.2):
+        poller.poll(lambda: aircraft(10, moved=8), clients=1, now=now)
+    assert poller.interval == 150
+
+
+def test_fingerprint_at_served_precision() -> None:
+    before = aircraft(2)
+    # A few hundred meters inside the same 10 km cell
+    after = [{**a, "latitude": a["latitude"] + 0.002, "longitude": 25.003} for a in before]
+    assert opensky_fingerprint(before) == opensky_fingerprint(after)
+    assert opensky_fingerprint(before) != opensky_fingerprint(aircraft(2, moved=1))
+
+
+def test_quiet_hours_save_credits() -> None:
+    def credits_used(count: int, step_deg: float) -> int:
+        budget = CreditBudget(daily_credits=4000, cost=lambda: 3)
+        poller = SourcePoller("openSky", PollPolicy(5, 300, opensky_fingerprint, budget))
+        now = MIDNIGHT
+        while now < MIDNIGHT + 6 * 3600:
+            position = (now - MIDNIGHT) * step_deg
+            records = [
+                {"icao24": f"{n:06x}", "latitude": 60.0 + n * 0.2, "longitude": 20.0 + position}
+                for n in range(count)
+            ]
+            poller.poll(lambda: records, clients=1, now=now)
+            now += 5
+        return budget.spent
+
+    # Two aircraft circling inside their cells compared with busy traffic crossing cells
+    quiet = credits_used(2, 0.0)
+    busy = credits_used(50, 0.002)
+    assert quiet * 3 < busy
+
+
+def test_cached_until_due() -> None:
+    fetch = MagicMock(return_value=aircraft(3))
+    poller = SourcePoller("openSky", PollPolicy(5, 300, opensky_fingerprint))
+
+    first = poller.poll(fetch, clients=1, now=MIDNIGHT)
+    assert poller.poll(fetch, clients=1, now=MIDNIGHT + 4) is first
+    assert fetch.call_count == 1
+
+    second = poller.poll(fetch, clients=1, now=MIDNIGHT + 5)
+    assert second.generation == first.generation + 1
+    assert fetch.call_count == 2
+
+
+def test_more_clients_shorten_interval() -> None:
+    poller = SourcePoller("openSky", PollPolicy(5, 300, opensky_fingerprint))
+    poller.interval = 120
+    assert poller.effective_interval(MIDNIGHT, 1) == 120
+    assert poller.effective_interval(MIDNIGHT, 4) == 40
+    assert poller.effective_interval(MIDNIGHT, 1024) == 120 / 11
+    # Never below the minimum
+    assert poller.effective_interval(MIDNIGHT, 2**30) == 5
+
+
+def test_credit_budget() -> None:
+    budget = CreditBudget(daily_credits=4000, cost=lambda: 4)
+    # A whole day left: 1000 requests, one every 86.4 s
+    assert budget.min_interval(MIDNIGHT) == DAY_SECONDS / 1000
+
+    poller = SourcePoller("openSky", PollPolicy(5, 300, opensky_fingerprint, budget))
+    assert poller.effective_interval(MIDNIGHT, 10) == DAY_SECONDS / 1000
+
+    # Nothing spent by 06:00, the saved credits allow polling faster than the flat rate
+    assert budget.min_interval(MIDNIGHT + 6 * 3600) == 0.0
+    budget.spent = 1000
+    assert budget.min_interval(MIDNIGHT + 6 * 3600) == DAY_SECONDS / 1000
+
+    # Upstream reports fewer credits than counted locally
+    reported = CreditBudget(daily_credits=4000, cost=lambda: 4, reported_remaining=lambda: 3)
+    reported.spend(MIDNIGHT)
+    assert reported.min_interval(MIDNIGHT + 3600) == DAY_SECONDS - 3600
+    # Credits are back the next day
+    assert reported.min_interval(MIDNIGHT + DAY_SECONDS) == DAY_SECONDS / 1000
+
+
+def test_failed_fetch_keeps_result() -> None:
+    budget = CreditBudget(daily_credits=4000, cost=lambda: 4)
+    poller = SourcePoller("openSky", PollPolicy(5, 300, opensky_fingerprint, budget))
+    fetch = MagicMock(return_value=None)
+
+    # Nothing fetched yet, an empty result that is not cached
+    assert poller.poll(fetch, clients=1, now=MIDNIGHT) == Polled([], 0)
+    assert budget.spent == 0
+
+    fetch.return_value = aircraft(3)
+    first = poller.poll(fetch, clients=1, now=MIDNIGHT + 5)
+    assert first.generation == 1
+    assert budget.spent == 4
+
+    # A failure serves the previous result and is retried after the minimum interval
+    poller.interval = 120
+    fetch.return_value = None
+    assert poller.poll(fetch, clients=1, now=MIDNIGHT + 200) is first
+    assert poller.poll(fetch, clients=1, now=MIDNIGHT + 204) is first
+    assert fetch.call_count == 3
+    assert budget.spent == 4
+
+    fetch.return_value = aircraft(3, moved=1)
+    assert poller.poll(fetch, clients=1, now=MIDNIGHT + 205).generation == 2
+    assert budget.spent == 8
+
+
+def test_credits_split_between_workers() -> None:
+    with (
+        patch("app.tasks.scheduler.settings.api_workers", 4),
+        patch("app.tasks.scheduler.radar_task.credits_remaining", 400),
+    ):
+        budget = create_scheduler().sources["openSky"].policy.budget
+        assert budget is not None
+        assert budget.daily_credits == 1000
+        budget.spend(MIDNIGHT)
+        assert budget.remaining(MIDNIGHT) == 100
+
+
+def test_client_window() -> None:
+    clients = ClientTracker(window_seconds=60)
+    clients.seen("10.0.0.1", now=0)
+    clients.seen("10.0.0.2", now=30)
+    clients.seen("10.0.0.1", now=50)
+    assert clients.active(now=70) == 2
+    assert clients.active(now=100) == 1
+    assert clients.active(now=200) == 0
+
+
+@patch("app.api.radar_api.fetch_fin_marine_traffic_data")
+@patch("app.api.radar_api.fetch_practice_data")
+@patch("app.api.radar_api.fetch_aircraft_data")
+def test_snapshot_reused_between_polls(
+    mock_fetch_opensky: MagicMock,
+    mock_fetch_practice: MagicMock,
+    mock_fetch_fin_marine: MagicMock,
+) -> None:
+    mock_fetch_opensky.return_value = aircraft(2)
+    mock_fetch_practice.return_value = []
+    mock_fetch_fin_marine.return_value = []
+
+    first = client.get("/radar/aircraft")
+    second = client.get("/radar/aircraft/clusters")
+    assert first.status_code == second.status_code == 200
+    assert mock_fetch_opensky.call_count == 1
+
+    with patch("app.tasks.scheduler.settings.adaptive_polling", False):
+        client.get("/radar/aircraft")
+    assert mock_fetch_opensky.call_count == 2
+
+
+@patch("app.api.radar_api.fetch_fin_marine_traffic_data")
+@patch("app.api.radar_api.fetch_practice_data")
+@patch("app.api.radar_api.fetch_aircraft_data")
+def test_failed_source_does_not_fail_request(
+    mock_fetch_opensky: MagicMock,
+    mock_fetch_practice: MagicMock,
+    mock_fetch_fin_marine: MagicMock,
+) -> None:
+    mock_fetch_opensky.return_value = aircraft(2)
+    mock_fetch_practice.return_value = None
+    mock_fetch_fin_marine.return_value = []
+
+    response = client.get("/radar/aircraft")
+    assert response.status_code == 200
+    assert len(response.json()) == 2
@@ -0,0 +1,167 @@
+import random
+import threading
+from typing import Any, Dict, List
+from unittest.mock import patch, MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.schemas.schema import TrackPoint, TransformedAircraft
+from app.spatial import Near, QueryCache, SpatialIndex, distance_km, parse_query
+
+client = TestClient(app)
+
+
+def test_parse_query() -> None:
+    assert parse_query(None, None, None, None) is None
+    query = parse_query("24,60,25.5,60.5", "60.17,24.94", 50, " 35vlg 86 ")
+    assert query is not None
+    assert query.bbox == (24, 60, 25.5, 60.5)
+    assert query.near == Near(60.17, 24.94, 50)
+    assert query.mgrs_prefix == "35VLG86"
+
+    for bad in (
+        ("24,60,25", None, None, None),
+        ("25,60,24,61", None, None, None),
+        (None, "60.17,24.94", None, None),
+        (None, "nan,24.94", 10, None),
+        (None, None, None, "35VLG8"),
+        (None, None, None, "LG86"),
+    ):
+        with pytest.raises(ValueError):
+            parse_query(*bad)
+
+
+def test_index_matches_scan() -> None:
+    generator = random.Random(3)
+    points = [
+        TrackPoint(n, str(n), "openSky", generator.uniform(59.5, 70), generator.uniform(19.5, 31.5))
+        for n in range(2000)
+    ]
+    index = SpatialIndex([{} for _ in points], points, cell_size=0.25)
+
+    bbox = (24.0, 60.0, 26.3, 61.1)
+    assert index.in_bbox(bbox) == {
+        p.track_index
+        for p in points
+        if bbox[1] <= p.latitude <= bbox[3] and bbox[0] <= p.longitude <= bbox[2]
+    }
+    # Box larger than the occupied area
+    assert index.in_bbox((-180, -90, 180, 90)) == set(range(2000))
+
+    near = Near(68.0, 27.0, 120)
+    assert index.near(near) == {
+        p.track_index
+        for p in points
+        if distance_km(near.latitude, near.longitude, p.latitude, p.longitude) <= 120
+    }
+
+
+def test_mgrs_prefix() -> None:
+    tracks: List[TransformedAircraft] = [
+        {"position": "35VLG8637612345"},
+        {"position": "35VLG8699912999"},
+        {"position": "35VMG1111111111"},
+        {"position": "34WDC6500012000"},
+        {"position": None},
+    ]
+    index = SpatialIndex(tracks, [], cell_size=0.25)
+    assert index.with_mgrs_prefix("35V") == {0, 1, 2}
+    assert index.with_mgrs_prefix("35VLG") == {0, 1}
+    assert index.with_mgrs_prefix("35VLG81") == {0, 1}
+    assert index.with_mgrs_prefix("35VLG863123") == {0}
+    assert index.with_mgrs_prefix("34") == {3}
+
+
+def test_query_cache_evicts_least_recently_used() -> None:
+    cache = QueryCache(maxsize=2)
+    factory = MagicMock(side_effect=lambda: object())
+    a = cache.get("a", factory)
+    cache.get("b", factory)
+    assert cache.get("a", factory) is a
+    cache.get("c", factory)  # Evicts b
+    assert cache.get("a", factory) is a
+    cache.get("b", factory)
+    assert factory.call_count == 4
+
+
+def test_query_cache_computes_outside_lock() -> None:
+    cache = QueryCache(maxsize=4)
+    release = threading.Event()
+    slow = MagicMock(side_effect=lambda: release.wait(5) and object())
+    results: List[object] = []
+
+    def get_slow() -> None:
+        results.append(cache.get("slow", slow))
+
+    threads = [threading.Thread(target=get_slow) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    # Other keys are served while the slow one is computed
+    assert cache.get("fast", lambda: 1) == 1
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert slow.call_count == 1
+    assert len(results) == 2 and results[0] is results[1]
+
+    # Failures are not cached
+    with pytest.raises(ZeroDivisionError):
+        cache.get("broken", lambda: 1 // 0)
+    assert cache.get("broken", lambda: 2) == 2
+
+
+dummy_opensky_data: List[Dict[str, Any]] = [
+    {
+        "icao24": f"46{n:04x}",
+        "callsign": f"FIN{n}",
+        "latitude": latitude,
+        "longitude": longitude,
+        "baro_altitude": 5000,
+        "velocity": 200,
+        "true_track": 180,
+        "on_ground": False,
+        "origin_country": "Finland",
+    }
+    for n, (latitude, longitude) in enumerate(
+        [(60.17, 24.94), (60.3, 25.1), (61.5, 23.76), (65.01, 25.47)]
+    )
+]
+
+
+@patch("app.api.radar_api.fetch_fin_marine_traffic_data")
+@patch("app.api.radar_api.fetch_practice_data")
+@patch("app.api.radar_api.fetch_aircraft_data")
+def test_filtered_aircraft_endpoint(
+    mock_fetch_opensky: MagicMock,
+    mock_fetch_practice: MagicMock,
+    mock_fetch_fin_marine: MagicMock,
+) -> None:
+    mock_fetch_opensky.return_value = dummy_opensky_data
+    mock_fetch_practice.return_value = []
+    mock_fetch_fin_marine.return_value = []
+
+    def ids(**params: Any) -> List[str]:
+        response = client.get("/radar/aircraft", params=params)
+        assert response.status_code == 200
+        return [track["aircraftId"] for track in response.json()]
+
+    everything = client.get("/radar/aircraft").json()
+    assert len(everything) == 4
+
+    assert ids(near="60.17,24.94", radius_km=25) == ["FIN0", "FIN1"]
+    assert ids(near="60.17,24.94", radius_km=5) == ["FIN0"]
+    assert ids(bbox="23,61,24,62") == ["FIN2"]
+    oulu = everything[3]["position"]
+    assert ids(mgrs_prefix=oulu[:5]) == ["FIN3"]
+    assert ids(mgrs_prefix=oulu, precision=1) == ["FIN3"]
+    assert ids(bbox="19,59,32,70", mgrs_prefix=oulu[:5]) == ["FIN3"]
+
+    precise = client.get("/radar/aircraft", params={"bbox": "23,61,24,62", "precision": 5})
+    assert len(precise.json()[0]["position"]) == len(oulu) + 8
+
+    assert client.get("/radar/aircraft", params={"bbox": "1,2,3"}).status_code == 400
+    assert client.get("/radar/aircraft", params={"near": "60,25"}).status_code == 400
+    assert client.get("/radar/aircraft", params={"mgrs_prefix": "XYZ"}).status_code == 400
+    assert mock_fetch_opensky.call_count == 1
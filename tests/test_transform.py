@@ -0,0 +1,98 @@
+import math
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+from app import transform
+from app.conflict import relative_position
+from app.transform import (
+    convert_to_mgrs,
+    rows_to_tracks,
+    shutdown_pool,
+    transform_chunked,
+    transform_marine_rows,
+    transform_opensky_rows,
+    transform_practice_rows,
+)
+
+
+def make_aircraft(number: int) -> Dict[str, Any]:
+    return {
+        "icao24": f"{number:06x}",
+        "callsign": f"FIN{number}",
+        "longitude": 20.0 + number * 0.01,
+        "latitude": 60.0 + number * 0.01,
+        "baro_altitude": 5000,
+        "velocity": 200,
+        "true_track": 180,
+        "on_ground": number % 10 == 0,
+        "origin_country": "Finland",
+    }
+
+
+def make_ship(mmsi: int) -> Dict[str, Any]:
+    return {
+        "mmsi": mmsi,
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [24.9667, 60.1666]},
+        "properties": {
+            "mmsi": mmsi,
+            "sog": 15.5,
+            "cog": 346.5,
+            "navStat": 1,
+            "rot": 4,
+            "posAcc": True,
+            "raim": True,
+            "heading": 79,
+            "timestamp": 59,
+            "timestampExternal": 1659212938646,
+        },
+    }
+
+
+def test_rows_to_tracks() -> None:
+    rows = transform_marine_rows([make_ship(219598000), {"mmsi": "broken"}], 1)
+    tracks, points = rows_to_tracks(rows)
+
+    assert len(tracks) == 1
+    assert tracks[0]["aircraftId"] == "219598000"
+    assert tracks[0]["position"] == "35VLG87"
+    assert points[0].key == "marineTraffic:219598000"
+    assert (points[0].latitude, points[0].longitude) == (60.1666, 24.9667)
+
+
+def test_practice_rows_at_cell_centre() -> None:
+    practice = [
+        {"id": 1, "position": convert_to_mgrs(24.94, 60.17, 1), "speed": "slow", "direction": 90},
+        {"id": 2, "position": convert_to_mgrs(24.94, 60.17, 3), "speed": 120, "direction": 45},
+    ]
+    _, points = rows_to_tracks(transform_practice_rows(practice))
+    exact = points[1]._replace(latitude=60.17, longitude=24.94)
+
+    # 10 km cell, the centre is at most half the diagonal from the true position
+    assert points[0].position_error == 5000 * math.sqrt(2)
+    assert math.hypot(*relative_position(exact, points[0])) <= points[0].position_error
+    assert (points[0].altitude, points[0].velocity, points[0].heading) == (None, None, 90)
+
+    assert points[1].position_error == 50 * math.sqrt(2)
+    assert math.hypot(*relative_position(exact, points[1])) <= points[1].position_error
+    assert (points[1].velocity, points[1].heading) == (120, 45)
+
+
+def test_pool_matches_inline() -> None:
+    aircraft: List[Dict[str, Any]] = [make_aircraft(number) for number in range(250)]
+    inline = transform_opensky_rows(aircraft, 5)
+
+    with (
+        patch("app.transform.settings.transform_workers", 2),
+        patch("app.transform.settings.transform_chunk_size", 40),
+    ):
+        try:
+            pooled = transform_chunked(transform_opensky_rows, aircraft, 5)
+            # A broken pool is shut down and the records transformed inline instead
+            assert transform._pool is not None
+        finally:
+            shutdown_pool()
+
+    # On ground aircraft are filtered, order is preserved across chunks
+    assert len(inline) == 225
+    assert pooled == inline